@@ -1,14 +1,43 @@
 """Application Streamlit de génération et de personnalisation de CV."""
 
 # -*- coding: utf-8 -*-
+import argparse
+import base64
+import bisect
+import cProfile
+import hashlib
 import io
+import json
+import math
+import mmap
+import os
+import pstats
+import random
+import re
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import unicodedata
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from dataclasses import asdict, dataclass, field, is_dataclass
+from functools import lru_cache, wraps
+from itertools import chain
+from string import Template
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from copy import deepcopy
 from uuid import uuid4
 from html import escape
 
+import numpy as np
 import streamlit as st
 
 # ====== THEME & CSS ======
@@ -288,6 +317,7 @@ def experience_to_dict(exp: Experience) -> Dict[str, Any]:
         "role": exp.role,
         "org": exp.org,
         "dates": exp.dates,
+        **period_fields(exp.dates),
         "bullets": exp.bullets.copy(),
         "tags": exp.tags.copy(),
         "enabled": True,
@@ -300,6 +330,7 @@ def education_to_dict(ed: EducationItem) -> Dict[str, Any]:
         "title": ed.title,
         "school": ed.school,
         "dates": ed.dates,
+        **period_fields(ed.dates),
         "details": ed.details,
         "enabled": True,
     }
@@ -326,26 +357,25 @@ def download_button_bytes(bin_bytes: bytes, filename: str, label: str) -> None:
     st.download_button(label, data=bin_bytes, file_name=filename, mime="application/pdf")
 
 
+def rerun() -> None:
+    # La modification qui déclenche le rerun est historisée tout de suite : sinon elle n'apparaîtrait
+    # dans l'historique qu'en fin de passe suivante, une fois la barre latérale déjà dessinée.
+    if "cv_general" in st.session_state:
+        record_history()
+    # st.experimental_rerun a été retiré des versions récentes de Streamlit au profit de st.rerun.
+    (getattr(st, "rerun", None) or st.experimental_rerun)()
+
+
 def init_state() -> None:
+    if "cv_general" not in st.session_state and SESSION_QUERY_PARAM in st.query_params:
+        try:
+            restore_session_token(st.query_params[SESSION_QUERY_PARAM])
+            # Arrivée par un lien à jeton : l'adresse continue de suivre la session.
+            st.session_state[SESSION_URL_STATE_KEY] = True
+        except ValueError as exc:
+            st.warning(f"{exc} – profil par défaut chargé.")
     if "cv_general" not in st.session_state:
-        st.session_state["cv_general"] = {
-            "name": seed.name,
-            "headline_base": seed.headline,
-            "headline": seed.headline,
-            "use_preset_headline": True,
-            "summary": seed.summary,
-            "location": seed.location,
-            "phone": seed.phone,
-            "email": seed.email,
-            "linkedin": seed.linkedin,
-            "websites": seed.websites.copy(),
-            "languages": seed.languages.copy(),
-            "softskills": seed.softskills.copy(),
-            "tools": seed.tools.copy(),
-            "interests": seed.interests.copy(),
-            "keywords": seed.keywords.copy(),
-            "use_preset_keywords": True,
-        }
+        st.session_state["cv_general"] = default_general_state()
     if "experiences" not in st.session_state:
         st.session_state["experiences"] = [experience_to_dict(exp) for exp in seed.experiences]
     if "education" not in st.session_state:
@@ -353,37 +383,31 @@ def init_state() -> None:
 
 
 def reset_state() -> None:
+    clear_entry_widgets(st.session_state["experiences"] + st.session_state["education"])
     st.session_state["experiences"] = [experience_to_dict(exp) for exp in seed.experiences]
     st.session_state["education"] = [education_to_dict(ed) for ed in seed.education]
-    st.session_state["cv_general"] = {
-        "name": seed.name,
-        "headline_base": seed.headline,
-        "headline": seed.headline,
-        "use_preset_headline": True,
-        "summary": seed.summary,
-        "location": seed.location,
-        "phone": seed.phone,
-        "email": seed.email,
-        "linkedin": seed.linkedin,
-        "websites": seed.websites.copy(),
-        "languages": seed.languages.copy(),
-        "softskills": seed.softskills.copy(),
-        "tools": seed.tools.copy(),
-        "interests": seed.interests.copy(),
-        "keywords": seed.keywords.copy(),
-        "use_preset_keywords": True,
-    }
+    st.session_state["cv_general"] = default_general_state()
 
 
-def apply_preset_to_state(preset: Dict[str, Any]) -> None:
-    experiences = st.session_state.get("experiences", [])
+def rank_experiences_for_preset(experiences: List[Dict[str, Any]], preset: Dict[str, Any]) -> List[Tuple[Dict[str, Any], bool]]:
     keep_tags = set(preset.get("keep_tags", []))
+    matches = [bool(keep_tags.intersection(set(map(str.strip, exp["tags"])))) for exp in experiences]
     indexed = list(enumerate(experiences))
     if keep_tags:
-        indexed.sort(key=lambda item: (0 if keep_tags.intersection(set(map(str.strip, item[1]["tags"]))) else 1, item[0]))
-    st.session_state["experiences"] = [deepcopy(item[1]) for item in indexed]
-    for exp in st.session_state["experiences"]:
-        exp["enabled"] = True if not keep_tags else bool(keep_tags.intersection(set(map(str.strip, exp["tags"]))))
+        indexed.sort(key=lambda item: (0 if matches[item[0]] else 1, item[0]))
+    return [(exp, True if not keep_tags else matches[idx]) for idx, exp in indexed]
+
+
+def apply_preset_to_state(preset: Dict[str, Any]) -> None:
+    ranked = rank_experiences_for_preset(st.session_state.get("experiences", []), preset)
+    st.session_state["experiences"] = [deepcopy(exp) for exp, _ in ranked]
+    for exp, (_, enabled) in zip(st.session_state["experiences"], ranked):
+        exp["enabled"] = enabled
+
+
+def default_sections_for_preset(preset: Dict[str, Any]) -> Dict[str, bool]:
+    hide_sections = set(preset.get("hide_sections", []))
+    return {label: label not in hide_sections and default for label, default in SECTION_DEFAULTS}
 
 
 def merge_keywords(base: List[str], extra: List[str]) -> List[str]:
@@ -397,17 +421,1485 @@ def merge_keywords(base: List[str], extra: List[str]) -> List[str]:
     return merged
 
 
+# Limites de taille appliquées aux champs entrants (surchargeables via la variable d’environnement CV_FIELD_LIMITS, en JSON).
+FIELD_LIMITS: Dict[str, int] = {
+    "name": 120,
+    "headline": 300,
+    "summary": 3000,
+    "contact": 300,
+    "list_item": 200,
+    "list_length": 60,
+    "role": 300,
+    "org": 300,
+    "dates": 80,
+    "bullet": 1000,
+    "bullets": 40,
+    "entries": 200,
+    "title": 300,
+    "school": 300,
+    "details": 2000,
+}
+FIELD_LIMITS.update({key: int(value) for key, value in json.loads(os.environ.get("CV_FIELD_LIMITS", "{}")).items()})
+
+
+def clamp_text(value: str, field_name: str) -> str:
+    limit = FIELD_LIMITS[field_name]
+    return value if len(value) <= limit else value[: max(limit - 1, 0)] + "…"
+
+
+def clamp_list(values: List[str], field_name: str = "list_item", length_name: str = "list_length") -> List[str]:
+    return [clamp_text(value, field_name) for value in values[: FIELD_LIMITS[length_name]]]
+
+
+def sanitize_cv(cv: CVData) -> CVData:
+    return CVData(
+        name=clamp_text(cv.name, "name"),
+        headline=clamp_text(cv.headline, "headline"),
+        location=clamp_text(cv.location, "contact"),
+        phone=clamp_text(cv.phone, "contact"),
+        email=clamp_text(cv.email, "contact"),
+        linkedin=clamp_text(cv.linkedin, "contact"),
+        websites=clamp_list(cv.websites, "contact"),
+        languages=clamp_list(cv.languages),
+        softskills=clamp_list(cv.softskills),
+        tools=clamp_list(cv.tools),
+        interests=clamp_list(cv.interests),
+        summary=clamp_text(cv.summary, "summary"),
+        experiences=[
+            Experience(
+                role=clamp_text(exp.role, "role"),
+                org=clamp_text(exp.org, "org"),
+                dates=clamp_text(exp.dates, "dates"),
+                bullets=clamp_list(exp.bullets, "bullet", "bullets"),
+                tags=clamp_list(exp.tags),
+            )
+            for exp in cv.experiences[: FIELD_LIMITS["entries"]]
+        ],
+        education=[
+            EducationItem(
+                title=clamp_text(edu.title, "title"),
+                school=clamp_text(edu.school, "school"),
+                dates=clamp_text(edu.dates, "dates"),
+                details=clamp_text(edu.details, "details"),
+            )
+            for edu in cv.education[: FIELD_LIMITS["entries"]]
+        ],
+        keywords=clamp_list(cv.keywords),
+    )
+
+
+# ====== HISTORIQUE ANNULER / RÉTABLIR (partage structurel) ======
+# Chaque instantané est un arbre de tuples immuables. Les entrées et champs inchangés réutilisent les nœuds
+# de l'instantané précédent : une étape ne coûte que les nœuds réellement modifiés.
+FrozenEntry = Tuple[Tuple[str, Any], ...]
+FrozenEntries = Tuple[Tuple[FrozenEntry, ...], ...]
+MAX_HISTORY_STEPS = 300
+HISTORY_CHUNK_SIZE = 16
+
+
+@dataclass(frozen=True)
+class StateSnapshot:
+    general: FrozenEntry
+    experiences: FrozenEntries
+    education: FrozenEntries
+
+
+def _share_value(value: Any, previous: Any) -> Any:
+    if not isinstance(value, list):
+        return previous if previous == value else value
+    if not isinstance(previous, tuple):
+        return tuple(value)
+    shared = tuple(
+        previous[idx] if idx < len(previous) and previous[idx] == item else item for idx, item in enumerate(value)
+    )
+    return previous if shared == previous else shared
+
+
+def _freeze_entry(entry: Dict[str, Any], previous: Optional[FrozenEntry]) -> FrozenEntry:
+    previous_pairs = {pair[0]: pair for pair in previous or ()}
+    pairs = []
+    for key, value in entry.items():
+        previous_pair = previous_pairs.get(key)
+        shared = _share_value(value, previous_pair[1] if previous_pair else None)
+        pairs.append(previous_pair if previous_pair is not None and previous_pair[1] is shared else (key, shared))
+    frozen = tuple(pairs)
+    return previous if previous is not None and frozen == previous else frozen
+
+
+def _freeze_entries(entries: List[Dict[str, Any]], previous: FrozenEntries) -> FrozenEntries:
+    # Vecteur persistant simplifié : les entrées sont rangées par blocs de HISTORY_CHUNK_SIZE et seuls
+    # les blocs modifiés sont recréés.
+    previous_by_uid = {dict(node).get("uid"): node for chunk in previous for node in chunk}
+    nodes = [_freeze_entry(entry, previous_by_uid.get(entry.get("uid"))) for entry in entries]
+    chunks = []
+    for chunk_idx, start in enumerate(range(0, len(nodes), HISTORY_CHUNK_SIZE)):
+        chunk = tuple(nodes[start:start + HISTORY_CHUNK_SIZE])
+        previous_chunk = previous[chunk_idx] if chunk_idx < len(previous) else None
+        chunks.append(previous_chunk if chunk == previous_chunk else chunk)
+    frozen = tuple(chunks)
+    return previous if frozen == previous else frozen
+
+
+def _thaw_entry(node: FrozenEntry) -> Dict[str, Any]:
+    return {key: list(value) if isinstance(value, tuple) else value for key, value in node}
+
+
+def _thaw_entries(chunks: FrozenEntries) -> List[Dict[str, Any]]:
+    return [_thaw_entry(node) for chunk in chunks for node in chunk]
+
+
+class UndoHistory:
+    def __init__(self, max_steps: int = MAX_HISTORY_STEPS) -> None:
+        self.max_steps = max_steps
+        self.past: List[StateSnapshot] = []
+        self.future: List[StateSnapshot] = []
+        self.current: Optional[StateSnapshot] = None
+
+    def record(self, general: Dict[str, Any], experiences: List[Dict[str, Any]], education: List[Dict[str, Any]]) -> bool:
+        previous = self.current
+        snapshot = StateSnapshot(
+            general=_freeze_entry(general, previous.general if previous else None),
+            experiences=_freeze_entries(experiences, previous.experiences if previous else ()),
+            education=_freeze_entries(education, previous.education if previous else ()),
+        )
+        if snapshot == previous:
+            return False
+        if previous is not None:
+            self.past.append(previous)
+            del self.past[: -self.max_steps]
+        self.current = snapshot
+        self.future.clear()
+        return True
+
+    def undo(self) -> Optional[StateSnapshot]:
+        if not self.past or self.current is None:
+            return None
+        self.future.append(self.current)
+        self.current = self.past.pop()
+        return self.current
+
+    def redo(self) -> Optional[StateSnapshot]:
+        if not self.future or self.current is None:
+            return None
+        self.past.append(self.current)
+        self.current = self.future.pop()
+        return self.current
+
+    def memory_bytes(self) -> int:
+        # Chaque nœud partagé n'est compté qu'une fois, comme en mémoire.
+        seen: set[int] = set()
+        total = 0
+        stack: List[Any] = [snapshot for snapshot in self.past + self.future + [self.current] if snapshot is not None]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, StateSnapshot):
+                stack.extend((node.general, node.experiences, node.education))
+            elif isinstance(node, tuple):
+                total += sys.getsizeof(node)
+                stack.extend(node)
+            else:
+                total += sys.getsizeof(node)
+        return total
+
+
+def record_history() -> bool:
+    history = st.session_state.setdefault("history", UndoHistory())
+    return history.record(st.session_state["cv_general"], st.session_state["experiences"], st.session_state["education"])
+
+
+def clear_entry_widgets(entries: List[Dict[str, Any]]) -> None:
+    # Les widgets indexés par uid (ou préfixés general_) gardent leur propre valeur : on les réinitialise pour
+    # afficher l'état restauré.
+    stale_uids = {entry["uid"] for entry in entries} | {"general"}
+    for key in list(st.session_state.keys()):
+        if isinstance(key, str) and key.split("_", 1)[0] in stale_uids:
+            del st.session_state[key]
+
+
+def restore_snapshot(snapshot: StateSnapshot) -> None:
+    experiences = _thaw_entries(snapshot.experiences)
+    education = _thaw_entries(snapshot.education)
+    clear_entry_widgets(st.session_state["experiences"] + st.session_state["education"] + experiences + education)
+    st.session_state["cv_general"] = _thaw_entry(snapshot.general)
+    st.session_state["experiences"] = experiences
+    st.session_state["education"] = education
+
+
+# ====== INSTANTANÉS DE SESSION COMPACTS ======
+# Jeton = base64url( octet de schéma | deflate brut( table de chaînes | arbre de valeurs balisé ) ).
+# Chaque chaîne (clés comprises) n'est écrite qu'une fois dans la table, l'arbre n'y fait référence que par
+# indice. Les champs dérivés (uid, périodes analysées) ne sont pas stockés : ils sont recalculés à la
+# restauration par profile_from_dict.
+SESSION_SNAPSHOT_SCHEMA = 1
+SESSION_QUERY_PARAM = "s"
+# Le jeton contient tout le profil (téléphone, e-mail…) : il n'est recopié dans l'adresse que sur demande,
+# l'adresse finissant dans l'historique du navigateur et les journaux des proxys.
+SESSION_URL_STATE_KEY = "session_in_url"
+SESSION_URL_MAX_CHARS = 4000
+# Le jeton vient de l'adresse, donc de n'importe qui : taille décompressée et imbrication sont bornées
+# (un profil réel tient en quelques dizaines de Ko et sur 4 niveaux).
+SESSION_MAX_BYTES = 2 * 1024 * 1024
+SESSION_MAX_DEPTH = 8
+SESSION_DERIVED_KEYS = frozenset({"uid", "start_month", "end_month", "ongoing", "sort_key"})
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE, _TAG_INT, _TAG_STR, _TAG_LIST, _TAG_DICT, _TAG_FLOAT = range(8)
+_FLOAT_STRUCT = struct.Struct("<d")
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _encode_value(value: Any, out: bytearray, strings: Dict[str, int]) -> None:
+    if value is None or isinstance(value, bool):
+        out.append(_TAG_NONE if value is None else _TAG_TRUE if value else _TAG_FALSE)
+    elif isinstance(value, int):
+        out.append(_TAG_INT)
+        _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif isinstance(value, float):
+        out.append(_TAG_FLOAT)
+        out += _FLOAT_STRUCT.pack(value)
+    elif isinstance(value, str):
+        out.append(_TAG_STR)
+        _write_varint(out, strings.setdefault(value, len(strings)))
+    elif isinstance(value, (list, tuple)):
+        out.append(_TAG_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _encode_value(item, out, strings)
+    elif isinstance(value, dict):
+        items = [(key, item) for key, item in value.items() if key not in SESSION_DERIVED_KEYS]
+        out.append(_TAG_DICT)
+        _write_varint(out, len(items))
+        for key, item in items:
+            _write_varint(out, strings.setdefault(key, len(strings)))
+            _encode_value(item, out, strings)
+    else:
+        raise TypeError(f"Valeur non sérialisable dans un instantané : {type(value).__name__}")
+
+
+def _decode_value(data: bytes, pos: int, strings: List[str], depth: int = 0) -> Tuple[Any, int]:
+    if depth > SESSION_MAX_DEPTH:
+        raise ValueError("imbrication trop profonde")
+    tag = data[pos]
+    pos += 1
+    if tag <= _TAG_TRUE:
+        return (None, False, True)[tag], pos
+    if tag == _TAG_INT:
+        raw, pos = _read_varint(data, pos)
+        return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1), pos
+    if tag == _TAG_FLOAT:
+        return _FLOAT_STRUCT.unpack_from(data, pos)[0], pos + _FLOAT_STRUCT.size
+    if tag == _TAG_STR:
+        index, pos = _read_varint(data, pos)
+        return strings[index], pos
+    if tag == _TAG_LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _decode_value(data, pos, strings, depth + 1)
+            items.append(item)
+        return items, pos
+    if tag == _TAG_DICT:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            key_index, pos = _read_varint(data, pos)
+            result[strings[key_index]], pos = _decode_value(data, pos, strings, depth + 1)
+        return result, pos
+    raise ValueError(f"Balise inconnue {tag}")
+
+
+def encode_session_snapshot(general: Dict[str, Any], experiences: List[Dict[str, Any]], education: List[Dict[str, Any]]) -> str:
+    strings: Dict[str, int] = {}
+    tree = bytearray()
+    _encode_value([general, experiences, education], tree, strings)
+    body = bytearray()
+    _write_varint(body, len(strings))
+    for text in strings:
+        encoded = text.encode("utf-8")
+        _write_varint(body, len(encoded))
+        body += encoded
+    body += tree
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    payload = bytes([SESSION_SNAPSHOT_SCHEMA]) + compressor.compress(bytes(body)) + compressor.flush()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+
+
+_SESSION_EXPERIENCE_TEMPLATE = {"role": "", "org": "", "dates": "", "bullets": [""], "tags": [""], "enabled": True}
+_SESSION_EDUCATION_TEMPLATE = {"title": "", "school": "", "dates": "", "details": "", "enabled": True}
+
+
+def _check_session_fields(entry: Any, template: Dict[str, Any], label: str) -> None:
+    # Un jeton bien formé peut porter n'importe quel arbre : chaque champ connu doit avoir le type du modèle.
+    if not isinstance(entry, dict):
+        raise ValueError(f"{label} : objet attendu")
+    for key, expected in template.items():
+        value = entry.get(key, expected)
+        if type(value) is not type(expected):
+            raise ValueError(f"{label} : champ « {key} » de type {type(value).__name__}")
+        if isinstance(expected, list) and expected and not all(isinstance(item, type(expected[0])) for item in value):
+            raise ValueError(f"{label} : champ « {key} » mal formé")
+
+
+def decode_session_snapshot(token: str) -> Dict[str, Any]:
+    try:
+        payload = base64.urlsafe_b64decode(token.strip() + "=" * (-len(token.strip()) % 4))
+        if not payload or payload[0] != SESSION_SNAPSHOT_SCHEMA:
+            raise ValueError(f"schéma {payload[0] if payload else '∅'} inconnu (attendu : {SESSION_SNAPSHOT_SCHEMA})")
+        inflater = zlib.decompressobj(-15)
+        body = inflater.decompress(payload[1:], SESSION_MAX_BYTES)
+        if inflater.unconsumed_tail:
+            raise ValueError(f"plus de {SESSION_MAX_BYTES // 1024} Ko une fois décompressé")
+        count, pos = _read_varint(body, 0)
+        strings = []
+        for _ in range(count):
+            length, pos = _read_varint(body, pos)
+            strings.append(body[pos : pos + length].decode("utf-8"))
+            pos += length
+        tree, _ = _decode_value(body, pos, strings)
+        if not (isinstance(tree, list) and len(tree) == 3):
+            raise ValueError("structure inattendue")
+        general, experiences, education = tree
+        _check_session_fields(general, default_general_state(), "infos générales")
+        for entries, template, label in (
+            (experiences, _SESSION_EXPERIENCE_TEMPLATE, "expériences"),
+            (education, _SESSION_EDUCATION_TEMPLATE, "formations"),
+        ):
+            if not isinstance(entries, list):
+                raise ValueError(f"{label} : liste attendue")
+            for entry in entries:
+                _check_session_fields(entry, template, label)
+        return profile_from_dict({"cv_general": general, "experiences": experiences, "education": education})
+    except (ValueError, IndexError, TypeError, AttributeError, KeyError, zlib.error) as exc:
+        raise ValueError(f"Instantané de session illisible : {exc}") from exc
+
+
+def restore_session_token(token: str) -> None:
+    profile = decode_session_snapshot(token)
+    clear_entry_widgets(st.session_state.get("experiences", []) + st.session_state.get("education", []))
+    st.session_state["cv_general"] = profile["cv_general"]
+    st.session_state["experiences"] = profile["experiences"]
+    st.session_state["education"] = profile["education"]
+    st.session_state["session_token"] = token
+
+
+def sync_session_token() -> None:
+    # Réécrit à chaque révision historisée (y compris celles enregistrées par rerun()) ; avec l'option
+    # activée, l'URL courante permet de retrouver la session après un rafraîchissement.
+    revision = st.session_state["history"].current
+    if st.session_state.get("session_token_revision") is not revision or "session_token" not in st.session_state:
+        st.session_state["session_token"] = encode_session_snapshot(
+            st.session_state["cv_general"], st.session_state["experiences"], st.session_state["education"]
+        )
+        st.session_state["session_token_revision"] = revision
+    token = st.session_state["session_token"]
+    if st.session_state.get(SESSION_URL_STATE_KEY) and len(token) <= SESSION_URL_MAX_CHARS:
+        if st.query_params.get(SESSION_QUERY_PARAM) != token:
+            st.query_params[SESSION_QUERY_PARAM] = token
+    elif SESSION_QUERY_PARAM in st.query_params:
+        del st.query_params[SESSION_QUERY_PARAM]
+
+
+# ====== CACHE PARTAGÉ ENTRE SESSIONS ======
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("CV_SHARED_CACHE_MB", "128")) * 1024 * 1024
+SHARED_CACHE_SESSION_MAX_BYTES = int(os.environ.get("CV_SHARED_CACHE_SESSION_MB", "16")) * 1024 * 1024
+EXPORT_STAMP_FORMAT = "%d/%m/%Y %H:%M"
+
+
+def _hash_default(value: Any) -> Any:
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.blake2b(bytes(value), digest_size=16).hexdigest()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return repr(value)
+
+
+def content_hash(*parts: Any) -> str:
+    payload = json.dumps(parts, default=_hash_default, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def approx_size(value: Any) -> int:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approx_size(item) for item in value)
+    if is_dataclass(value):
+        return approx_size(vars(value))
+    return sys.getsizeof(value)
+
+
+def current_session_id() -> str:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return "process"
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "process"
+
+
+class SharedCache:
+    def __init__(self, max_bytes: int, session_max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int, str]]" = OrderedDict()
+        self._session_bytes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, *, size: Optional[int] = None, session_id: Optional[str] = None) -> Any:
+        size = approx_size(value) if size is None else size
+        owner = session_id or current_session_id()
+        if size > min(self.max_bytes, self.session_max_bytes):
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self._entries[key] = (value, size, owner)
+            self.total_bytes += size
+            self._session_bytes[owner] = self._session_bytes.get(owner, 0) + size
+            # Quota par session d'abord (les entrées les plus anciennes de cette session), puis plafond global LRU.
+            while self._session_bytes[owner] > self.session_max_bytes:
+                self._evict(next(k for k, entry in self._entries.items() if entry[2] == owner))
+            while self.total_bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+        return value
+
+    def get_or_create(
+        self, key: str, factory: Callable[[], Any], *, size: Optional[int] = None, session_id: Optional[str] = None
+    ) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, factory(), size=size, session_id=session_id)
+        return value
+
+    def session_usage(self, session_id: Optional[str] = None) -> int:
+        with self._lock:
+            return self._session_bytes.get(session_id or current_session_id(), 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "sessions": len(self._session_bytes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self, key: str) -> None:
+        _, size, owner = self._entries.pop(key)
+        self.total_bytes -= size
+        remaining = self._session_bytes.get(owner, 0) - size
+        if remaining > 0:
+            self._session_bytes[owner] = remaining
+        else:
+            self._session_bytes.pop(owner, None)
+        self.evictions += 1
+
+
+@st.cache_resource
+def get_shared_cache() -> SharedCache:
+    return SharedCache(SHARED_CACHE_MAX_BYTES, SHARED_CACHE_SESSION_MAX_BYTES)
+
+
+# Streamlit réexécute le module à chaque interaction : un lru_cache de niveau module repartirait à vide
+# à chaque rerun. Les mémos sont donc rangés dans un registre par processus, indexé par le bytecode.
+@st.cache_resource
+def _process_memo_registry() -> Dict[str, Any]:
+    return {}
+
+
+def _code_fingerprint(code: Any) -> bytes:
+    parts = [code.co_code]
+    for const in code.co_consts:
+        parts.append(_code_fingerprint(const) if isinstance(const, type(code)) else repr(const).encode("utf-8"))
+    return b"\0".join(parts)
+
+
+def process_lru_cache(maxsize: int) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        digest = hashlib.blake2b(_code_fingerprint(func.__code__), digest_size=8).hexdigest()
+        return _process_memo_registry().setdefault(f"{func.__qualname__}:{digest}", lru_cache(maxsize=maxsize)(func))
+
+    return decorator
+
+
+def _seed_general_template() -> Dict[str, Any]:
+    return {
+        "name": seed.name,
+        "headline_base": seed.headline,
+        "headline": seed.headline,
+        "use_preset_headline": True,
+        "summary": seed.summary,
+        "location": seed.location,
+        "phone": seed.phone,
+        "email": seed.email,
+        "linkedin": seed.linkedin,
+        "websites": tuple(seed.websites),
+        "languages": tuple(seed.languages),
+        "softskills": tuple(seed.softskills),
+        "tools": tuple(seed.tools),
+        "interests": tuple(seed.interests),
+        "keywords": tuple(seed.keywords),
+        "use_preset_keywords": True,
+        "recent_years": 0,
+    }
+
+
+def default_general_state() -> Dict[str, Any]:
+    # Le modèle immuable est construit une fois par processus ; chaque session ne reçoit que des listes
+    # modifiables qui référencent les mêmes chaînes.
+    template = get_shared_cache().get_or_create("seed:general", _seed_general_template)
+    return {key: list(value) if isinstance(value, tuple) else value for key, value in template.items()}
+
+
+# ====== PÉRIODES (dates structurées) ======
+# Les périodes saisies librement (« Oct. 2023 – Aujourd’hui », « 2019 – 2023 ») sont analysées une seule fois,
+# à la saisie, en mois ordinaux (année × 12 + mois - 1) stockés dans l'entrée avec une clé de tri entière.
+MONTH_NAMES: Dict[str, int] = {
+    name: month
+    for month, names in enumerate(
+        (
+            ("janvier", "janv", "jan", "january"),
+            ("fevrier", "fevr", "fev", "february", "feb"),
+            ("mars", "mar", "march"),
+            ("avril", "avr", "april", "apr"),
+            ("mai", "may"),
+            ("juin", "june", "jun"),
+            ("juillet", "juil", "july", "jul"),
+            ("aout", "august", "aug"),
+            ("septembre", "sept", "sep", "september"),
+            ("octobre", "oct", "october"),
+            ("novembre", "nov", "november"),
+            ("decembre", "dec", "december"),
+        ),
+        start=1,
+    )
+    for name in names
+}
+_DATE_TOKEN_RE = re.compile(
+    r"(?P<present>\b(?:aujourd\W?hui|present|now|today|current(?:ly)?|en cours|actuel(?:lement)?|ce jour)\b)"
+    r"|(?P<num>\d{1,2})[/.](?P<num_year>(?:19|20)\d{2})"
+    r"|(?:(?P<month>[a-z]+)\.?\s+)?(?P<year>(?:19|20)\d{2})"
+)
+_OPEN_ENDED_RE = re.compile(r"\b(?:depuis|since|from)\b")
+ONGOING_SORT_MONTH = 999_999
+SORT_KEY_FACTOR = 1_000_000
+
+
+def _month_ordinal(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+
+def current_month() -> int:
+    today = datetime.now()
+    return _month_ordinal(today.year, today.month)
+
+
+def parse_period(text: str) -> Tuple[Optional[int], Optional[int], bool]:
+    points: List[Optional[Tuple[int, Optional[int]]]] = []
+    for match in _DATE_TOKEN_RE.finditer(normalize_text(text)):
+        if match["present"]:
+            points.append(None)
+        elif match["num"]:
+            month = int(match["num"])
+            points.append((int(match["num_year"]), month if 1 <= month <= 12 else None))
+        else:
+            points.append((int(match["year"]), MONTH_NAMES.get(match["month"] or "")))
+        if len(points) == 2:
+            break
+    dated = [point for point in points if point is not None]
+    if not dated:
+        return None, None, False
+    start_year, start_month = dated[0]
+    ongoing = None in points or (len(points) == 1 and bool(_OPEN_ENDED_RE.search(normalize_text(text))))
+    start = _month_ordinal(start_year, start_month or 1)
+    if ongoing:
+        return start, None, True
+    end_year, end_month = dated[-1]
+    return start, max(start, _month_ordinal(end_year, end_month or 12)), False
+
+
+def period_fields(text: str) -> Dict[str, Any]:
+    start, end, ongoing = parse_period(text)
+    if start is None:
+        sort_key = 0
+    else:
+        sort_key = (ONGOING_SORT_MONTH if ongoing else end) * SORT_KEY_FACTOR + start
+    return {"start_month": start, "end_month": end, "ongoing": ongoing, "sort_key": sort_key}
+
+
+def set_entry_dates(entry: Dict[str, Any], dates: str) -> None:
+    if dates != entry.get("dates") or "sort_key" not in entry:
+        entry["dates"] = dates
+        entry.update(period_fields(dates))
+
+
+@dataclass(frozen=True)
+class PeriodIndex:
+    """Colonnes numpy des périodes d'une bibliothèque d'entrées (-1 = date inconnue)."""
+
+    starts: np.ndarray
+    ends: np.ndarray
+    ongoing: np.ndarray
+    sort_keys: np.ndarray
+
+    @classmethod
+    def from_entries(cls, entries: List[Dict[str, Any]]) -> "PeriodIndex":
+        fields = [entry if "sort_key" in entry else period_fields(entry.get("dates", "")) for entry in entries]
+        count = len(fields)
+        return cls(
+            starts=np.fromiter((-1 if f["start_month"] is None else f["start_month"] for f in fields), np.int64, count),
+            ends=np.fromiter((-1 if f["end_month"] is None else f["end_month"] for f in fields), np.int64, count),
+            ongoing=np.fromiter((f["ongoing"] for f in fields), bool, count),
+            sort_keys=np.fromiter((f["sort_key"] for f in fields), np.int64, count),
+        )
+
+    def resolved_ends(self, now: Optional[int] = None) -> np.ndarray:
+        return np.where(self.ongoing, current_month() if now is None else now, self.ends)
+
+    def chronological_order(self, newest_first: bool = True) -> np.ndarray:
+        return np.argsort(-self.sort_keys if newest_first else self.sort_keys, kind="stable")
+
+    def active_since(self, since: int, *, now: Optional[int] = None, keep_undated: bool = True) -> np.ndarray:
+        undated = self.starts < 0
+        return np.where(undated, keep_undated, self.resolved_ends(now) >= since)
+
+    def total_months(self, mask: Optional[np.ndarray] = None, *, now: Optional[int] = None) -> int:
+        # Union des intervalles : les chevauchements (postes cumulés) ne sont comptés qu'une fois.
+        selected = self.starts >= 0 if mask is None else mask & (self.starts >= 0)
+        starts = self.starts[selected]
+        ends = self.resolved_ends(now)[selected]
+        if not starts.size:
+            return 0
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], ends[order]
+        reach = np.maximum.accumulate(ends)
+        segment_heads = np.flatnonzero(np.concatenate(([True], starts[1:] > reach[:-1])))
+        segment_ends = np.maximum.reduceat(ends, segment_heads)
+        return int(np.maximum(segment_ends - starts[segment_heads] + 1, 0).sum())
+
+
+def sort_entries_chronologically(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [entries[index] for index in PeriodIndex.from_entries(entries).chronological_order()]
+
+
+def included_experiences(general: Dict[str, Any], experiences: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    enabled = [exp for exp in experiences if exp.get("enabled", True)]
+    recent_years = general.get("recent_years", 0)
+    if not recent_years or not enabled:
+        return enabled
+    keep = PeriodIndex.from_entries(enabled).active_since(current_month() - 12 * recent_years)
+    return [exp for exp, kept in zip(enabled, keep) if kept]
+
+
+def format_duration(months: int) -> str:
+    years, months = divmod(months, 12)
+    parts = [f"{years} an{'s' if years > 1 else ''}" if years else "", f"{months} mois" if months else ""]
+    return " ".join(part for part in parts if part) or "0 mois"
+
+
+# ====== DOUBLONS DE POINTS CLÉS (MinHash / LSH) ======
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16  # 16 bandes de 4 lignes : seuil LSH ≈ (1/16) ** (1/4) ≈ 0.5
+NEAR_DUPLICATE_THRESHOLD = 0.6
+MAX_DUPLICATE_CLUSTERS_SHOWN = 25
+MAX_LSH_BUCKET_SIZE = 64
+MINHASH_CACHE_SIZE = 65536
+_MINHASH_PRIME = np.uint64(4294967291)  # plus grand nombre premier < 2**32
+_minhash_rng = random.Random(20240611)
+_MINHASH_A = np.array([_minhash_rng.randrange(1, 1 << 31) for _ in range(MINHASH_PERMUTATIONS)], dtype=np.uint64)
+_MINHASH_B = np.array([_minhash_rng.randrange(0, 1 << 31) for _ in range(MINHASH_PERMUTATIONS)], dtype=np.uint64)
+_LSH_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+_LSH_MIX = np.array([_minhash_rng.randrange(1, 1 << 63) | 1 for _ in range(_LSH_ROWS)], dtype=np.uint64)
+
+
+def normalize_text(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@process_lru_cache(maxsize=65536)
+def bullet_shingles(text: str) -> Tuple[int, ...]:
+    words = re.findall(r"\w+", normalize_text(text))
+    grams = words if len(words) < 2 else [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return tuple(sorted({zlib.crc32(gram.encode("utf-8")) for gram in grams}))
+
+
+def minhash_signatures(shingle_sets: List[Tuple[int, ...]]) -> np.ndarray:
+    count = len(shingle_sets)
+    signatures = np.full((count, MINHASH_PERMUTATIONS), np.iinfo(np.uint64).max, dtype=np.uint64)
+    lengths = np.fromiter((len(shingles) for shingles in shingle_sets), dtype=np.int64, count=count)
+    non_empty = np.flatnonzero(lengths)
+    if non_empty.size == 0:
+        return signatures
+    flat = np.fromiter(chain.from_iterable(shingle_sets), dtype=np.uint64, count=int(lengths.sum()))
+    starts = (np.cumsum(lengths) - lengths)[non_empty]
+    # Une passe vectorisée par permutation : le coût reste linéaire dans le nombre total de shingles.
+    for k in range(MINHASH_PERMUTATIONS):
+        hashed = (flat * _MINHASH_A[k] + _MINHASH_B[k]) % _MINHASH_PRIME
+        signatures[non_empty, k] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def cached_minhash_signatures(texts: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    # Signatures mémorisées par texte de point clé : après une édition, seuls les textes nouveaux sont hachés.
+    cache = _process_memo_registry().setdefault("minhash_rows", {"lock": threading.Lock(), "rows": OrderedDict()})
+    signatures = np.empty((len(texts), MINHASH_PERMUTATIONS), dtype=np.uint64)
+    non_empty = np.zeros(len(texts), dtype=bool)
+    missing: Dict[str, List[int]] = {}
+    with cache["lock"]:
+        rows = cache["rows"]
+        for idx, text in enumerate(texts):
+            row = rows.get(text)
+            if row is None:
+                missing.setdefault(text, []).append(idx)
+            else:
+                rows.move_to_end(text)
+                signatures[idx], non_empty[idx] = row
+    if missing:
+        shingle_sets = [bullet_shingles(text) for text in missing]
+        fresh = minhash_signatures(shingle_sets)
+        with cache["lock"]:
+            rows = cache["rows"]
+            for (text, indices), row, shingles in zip(missing.items(), fresh, shingle_sets):
+                rows[text] = (row, bool(shingles))
+                signatures[indices], non_empty[indices] = row, bool(shingles)
+            while len(rows) > MINHASH_CACHE_SIZE:
+                rows.popitem(last=False)
+    return signatures, non_empty
+
+
+def _bucket_pairs(members: np.ndarray) -> np.ndarray:
+    # Toutes les paires d'un seau ; au-delà de MAX_LSH_BUCKET_SIZE (textes quasi identiques en masse),
+    # chaque membre n'est comparé qu'aux premiers du seau pour borner le coût.
+    head = members[:MAX_LSH_BUCKET_SIZE]
+    left, right = np.triu_indices(head.size, k=1)
+    pairs = [np.stack([head[left], head[right]], axis=1)]
+    if members.size > MAX_LSH_BUCKET_SIZE:
+        tail = members[MAX_LSH_BUCKET_SIZE:]
+        pairs.append(np.stack([np.repeat(head, tail.size), np.tile(tail, head.size)], axis=1))
+    return np.concatenate(pairs)
+
+
+def _lsh_candidate_pairs(signatures: np.ndarray, active: np.ndarray) -> np.ndarray:
+    pairs: List[np.ndarray] = []
+    for band in range(MINHASH_BANDS):
+        block = signatures[active, band * _LSH_ROWS:(band + 1) * _LSH_ROWS]
+        keys = (block * _LSH_MIX).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        sizes = np.diff(np.concatenate((starts, [sorted_keys.size])))
+        for start, size in zip(starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+            pairs.append(_bucket_pairs(active[order[start:start + size]]))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+@process_lru_cache(maxsize=4)
+def find_near_duplicate_bullets(bullets: Tuple[str, ...]) -> Tuple[Tuple[int, ...], ...]:
+    signatures, non_empty = cached_minhash_signatures(bullets)
+    active = np.flatnonzero(non_empty)
+    candidates = _lsh_candidate_pairs(signatures, active)
+    if not candidates.size:
+        return ()
+    similarity = (signatures[candidates[:, 0]] == signatures[candidates[:, 1]]).mean(axis=1)
+    parent = list(range(len(bullets)))
+
+    def find(node: int) -> int:
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for left, right in candidates[similarity >= NEAR_DUPLICATE_THRESHOLD].tolist():
+        root_left, root_right = find(left), find(right)
+        if root_left != root_right:
+            parent[max(root_left, root_right)] = min(root_left, root_right)
+    clusters: Dict[int, List[int]] = {}
+    for node in active.tolist():
+        clusters.setdefault(find(node), []).append(node)
+    return tuple(tuple(members) for _, members in sorted(clusters.items()) if len(members) > 1)
+
+
+def merge_bullet_cluster(experiences: List[Dict[str, Any]], refs: List[Tuple[int, int]]) -> None:
+    keep_exp, keep_bullet = refs[0]
+    longest = max((experiences[exp_idx]["bullets"][bullet_idx] for exp_idx, bullet_idx in refs), key=len)
+    experiences[keep_exp]["bullets"][keep_bullet] = longest
+    for exp_idx, bullet_idx in sorted(refs[1:], reverse=True):
+        experiences[exp_idx]["bullets"].pop(bullet_idx)
+    for exp_idx in {exp_idx for exp_idx, _ in refs}:
+        st.session_state.pop(f"{experiences[exp_idx]['uid']}_bullets", None)
+
+
+# ====== RECHERCHE PLEIN TEXTE (index inversé incrémental) ======
+# Un document = un champ indexé d'une entrée (intitulé, organisation, tags, détails) ou un point clé.
+# Seules les entrées dont le contenu a changé depuis le dernier rerun sont réindexées.
+SEARCH_FIELD_WEIGHTS = {"role": 1.5, "org": 1.2, "tags": 1.2, "bullets": 1.0, "details": 1.0}
+SEARCH_PREFIX_PENALTY = 0.7
+SEARCH_MIN_PREFIX = 2  # en deçà, un mot de la requête ne s'étend pas en préfixe (« d » couvrirait tout l'index)
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+MAX_SEARCH_RESULTS = 20
+
+DocKey = Tuple[str, str, int]  # (uid, champ, position du point clé)
+
+
+def search_tokens(text: str) -> List[str]:
+    return re.findall(r"\w+", normalize_text(text))
+
+
+@dataclass
+class SearchHit:
+    uid: str
+    kind: str
+    field: str
+    position: int
+    text: str
+    score: float
+
+
+def _entry_documents(kind: str, entry: Dict[str, Any]) -> List[Tuple[str, int, str]]:
+    if kind == "education":
+        return [("details", 0, entry.get("details", ""))]
+    documents = [("role", 0, entry.get("role", "")), ("org", 0, entry.get("org", "")), ("tags", 0, ", ".join(entry.get("tags", [])))]
+    documents.extend(("bullets", position, bullet) for position, bullet in enumerate(entry.get("bullets", [])))
+    return documents
+
+
+class SearchIndex:
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[DocKey, int]] = {}
+        self.vocabulary: List[str] = []  # trié, pour l'expansion des préfixes par dichotomie
+        self.documents: Dict[DocKey, Tuple[str, int]] = {}  # texte, nombre de tokens
+        self.total_length = 0
+        self._entry_docs: Dict[str, List[DocKey]] = {}
+        self._entry_kinds: Dict[str, str] = {}
+        self._entry_signatures: Dict[str, Tuple[Any, ...]] = {}
+
+    def sync(self, kind: str, entries: List[Dict[str, Any]]) -> int:
+        seen = set()
+        updated = 0
+        for entry in entries:
+            uid = entry["uid"]
+            seen.add(uid)
+            documents = _entry_documents(kind, entry)
+            signature = tuple(text for _, _, text in documents)
+            if self._entry_signatures.get(uid) != signature:
+                self.remove_entry(uid)
+                self._add_entry(kind, uid, documents, signature)
+                updated += 1
+        for uid in [uid for uid, entry_kind in self._entry_kinds.items() if entry_kind == kind and uid not in seen]:
+            self.remove_entry(uid)
+            updated += 1
+        return updated
+
+    def _add_entry(self, kind: str, uid: str, documents: List[Tuple[str, int, str]], signature: Tuple[Any, ...]) -> None:
+        keys = []
+        for field_name, position, text in documents:
+            tokens = search_tokens(text)
+            if not tokens:
+                continue
+            key = (uid, field_name, position)
+            keys.append(key)
+            self.documents[key] = (text, len(tokens))
+            self.total_length += len(tokens)
+            for token in tokens:
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = {}
+                    bisect.insort(self.vocabulary, token)
+                postings[key] = postings.get(key, 0) + 1
+        self._entry_docs[uid] = keys
+        self._entry_kinds[uid] = kind
+        self._entry_signatures[uid] = signature
+
+    def remove_entry(self, uid: str) -> None:
+        for key in self._entry_docs.pop(uid, []):
+            text, length = self.documents.pop(key)
+            self.total_length -= length
+            for token in set(search_tokens(text)):
+                postings = self.postings[token]
+                del postings[key]
+                if not postings:
+                    del self.postings[token]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+        self._entry_kinds.pop(uid, None)
+        self._entry_signatures.pop(uid, None)
+
+    def _expand(self, prefix: str) -> List[str]:
+        if len(prefix) < SEARCH_MIN_PREFIX:
+            return [prefix] if prefix in self.postings else []
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff", lo=start)
+        return self.vocabulary[start:end]
+
+    def search(self, query: str, limit: int = MAX_SEARCH_RESULTS) -> List[SearchHit]:
+        # Chaque mot de la requête doit apparaître (tel quel ou en préfixe) ; score BM25 pondéré par champ.
+        if not self.documents:
+            return []
+        # Les mots les plus sélectifs d'abord : les suivants ne parcourent que les documents encore candidats.
+        expansions = sorted(
+            ((token, self._expand(token)) for token in dict.fromkeys(search_tokens(query))),
+            key=lambda pair: sum(len(self.postings[term]) for term in pair[1]),
+        )
+        doc_count = len(self.documents)
+        average_length = self.total_length / doc_count
+        scores: Optional[Dict[DocKey, float]] = None
+        for token, terms in expansions:
+            token_scores: Dict[DocKey, float] = {}
+            for term in terms:
+                postings = self.postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = idf * (1.0 if term == token else SEARCH_PREFIX_PENALTY)
+                if scores is None or len(postings) <= len(scores):
+                    candidates = [(key, frequency) for key, frequency in postings.items() if scores is None or key in scores]
+                else:
+                    candidates = [(key, postings[key]) for key in scores if key in postings]
+                for key, frequency in candidates:
+                    length = self.documents[key][1]
+                    norm = frequency * (SEARCH_BM25_K1 + 1) / (
+                        frequency + SEARCH_BM25_K1 * (1 - SEARCH_BM25_B + SEARCH_BM25_B * length / average_length)
+                    )
+                    token_scores[key] = max(token_scores.get(key, 0.0), weight * norm)
+            scores = token_scores if scores is None else {key: scores[key] + value for key, value in token_scores.items()}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        ranked = sorted(scores.items(), key=lambda item: -item[1] * SEARCH_FIELD_WEIGHTS[item[0][1]])[:limit]
+        return [
+            SearchHit(
+                uid=uid,
+                kind=self._entry_kinds[uid],
+                field=field_name,
+                position=position,
+                text=self.documents[(uid, field_name, position)][0],
+                score=score * SEARCH_FIELD_WEIGHTS[field_name],
+            )
+            for (uid, field_name, position), score in ranked
+        ]
+
+
+def highlight_matches(text: str, query: str) -> str:
+    tokens = search_tokens(query)
+    prefixes = tuple(token for token in tokens if len(token) >= SEARCH_MIN_PREFIX)
+    exact = {token for token in tokens if len(token) < SEARCH_MIN_PREFIX}
+    parts = []
+    last = 0
+    for match in re.finditer(r"\w+", text):
+        word = normalize_text(match.group())
+        if word in exact or (prefixes and word.startswith(prefixes)):
+            parts.append(escape(text[last : match.start()]))
+            parts.append(f"**{escape(match.group())}**")
+            last = match.end()
+    parts.append(escape(text[last:]))
+    return "".join(parts)
+
+
+# ====== PROFILAGE À LA DEMANDE (cProfile + tracemalloc) ======
+# CLI : CV_PROFILE_NEXT=pdf capture le prochain rendu PDF du processus (une seule fois), le rapport est écrit
+# dans CV_PROFILE_DIR (dossier courant par défaut). Interface : voir « Diagnostic de performance ».
+PROFILE_ENV_VAR = "CV_PROFILE_NEXT"
+PROFILE_DIR_ENV_VAR = "CV_PROFILE_DIR"
+PROFILE_TARGETS = {"rerun": "Prochain rerun complet", "pdf": "Prochain export PDF"}
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_TRACE_FRAMES = 1
+PROFILE_MAX_REPORTS = 3
+
+
+@dataclass
+class ProfileReport:
+    target: str
+    label: str
+    captured_at: datetime
+    elapsed: float
+    peak_bytes: int
+    text: str
+
+    @property
+    def file_name(self) -> str:
+        return f"profil_{self.target}_{self.captured_at:%Y%m%d_%H%M%S}_{os.getpid()}.txt"
+
+
+def _profiler_state() -> Dict[str, Any]:
+    return _process_memo_registry().setdefault("profiler", {"lock": threading.Lock(), "active": False, "env_consumed": False})
+
+
+def claim_env_profile_request(target: str) -> bool:
+    if os.environ.get(PROFILE_ENV_VAR, "").strip().lower() != target:
+        return False
+    state = _profiler_state()
+    with state["lock"]:
+        if state["env_consumed"]:
+            return False
+        state["env_consumed"] = True
+    return True
+
+
+def format_profile_report(
+    report: ProfileReport, profiler: "cProfile.Profile", snapshot: "tracemalloc.Snapshot", interrupted_by: Optional[str]
+) -> str:
+    out = io.StringIO()
+    out.write(f"Profil « {report.label} » ({PROFILE_TARGETS.get(report.target, report.target)})\n")
+    out.write(f"Capturé le {report.captured_at:%Y-%m-%d %H:%M:%S}, PID {os.getpid()}, Python {sys.version.split()[0]}\n")
+    out.write(f"Durée : {report.elapsed * 1000:.1f} ms – pic mémoire suivi : {report.peak_bytes / 1024 / 1024:.2f} Mo\n")
+    if interrupted_by:
+        out.write(f"Exécution interrompue par {interrupted_by} (mesures partielles).\n")
+    out.write(f"\n=== {PROFILE_TOP_FUNCTIONS} fonctions les plus coûteuses (temps cumulé) ===\n")
+    pstats.Stats(profiler, stream=out).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_FUNCTIONS)
+    out.write(f"=== {PROFILE_TOP_ALLOCATIONS} principaux sites d’allocation (mémoire encore allouée en fin de capture) ===\n")
+    snapshot = snapshot.filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+    )
+    for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        out.write(f"{stat.size / 1024:10.1f} Kio {stat.count:8d} blocs  {frame.filename}:{frame.lineno}\n")
+    return out.getvalue()
+
+
+class ProfileCapture:
+    # Un seul profileur à la fois par processus : une capture imbriquée (export PDF pendant un rerun profilé)
+    # s'exécute sans instrumentation et `report` reste à None.
+    def __init__(self, target: str, label: str) -> None:
+        self.target = target
+        self.label = label
+        self.report: Optional[ProfileReport] = None
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def __enter__(self) -> "ProfileCapture":
+        state = _profiler_state()
+        with state["lock"]:
+            if state["active"]:
+                return self
+            state["active"] = True
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(PROFILE_TRACE_FRAMES)
+        tracemalloc.reset_peak()
+        self._captured_at = datetime.now()
+        self._profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        elapsed = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+        _profiler_state()["active"] = False
+        report = ProfileReport(self.target, self.label, self._captured_at, elapsed, peak, "")
+        report.text = format_profile_report(report, self._profiler, snapshot, exc_type.__name__ if exc_type else None)
+        self.report = report
+        self._profiler = None
+
+
+def save_profile_report(report: ProfileReport, directory: Optional[str] = None) -> str:
+    directory = directory or os.environ.get(PROFILE_DIR_ENV_VAR) or "."
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, report.file_name)
+    _write_atomically(path, lambda handle: handle.write(report.text.encode("utf-8")))
+    return path
+
+
+def profile_on_demand(target: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not claim_env_profile_request(target):
+                return func(*args, **kwargs)
+            capture = ProfileCapture(target, func.__qualname__)
+            try:
+                with capture:
+                    return func(*args, **kwargs)
+            finally:
+                if capture.report:
+                    print(f"[profil] Rapport écrit dans {save_profile_report(capture.report)}", file=sys.stderr, flush=True)
+
+        return wrapper
+
+    return decorator
+
+
 # ====== PDF (ReportLab) ======
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.lib.units import cm
 from reportlab.lib.colors import HexColor
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+
+@dataclass
+class LayoutBlock:
+    section: str
+    key: str
+    label: str
+    column: str
+    top: float
+    bottom: float
+    placed: bool = True
+
+    @property
+    def height(self) -> float:
+        return self.top - self.bottom
+
+
+@dataclass
+class PageLayout:
+    body_top: float
+    body_bottom: float
+    main_bottom: float
+    side_bottom: float
+    truncated: bool
+    blocks: List[LayoutBlock] = field(default_factory=list)
+
+    def fill_ratio(self, column: str) -> float:
+        bottom = self.main_bottom if column == "main" else self.side_bottom
+        return (self.body_top - bottom) / (self.body_top - self.body_bottom)
+
+    @property
+    def dropped(self) -> List[LayoutBlock]:
+        return [block for block in self.blocks if not block.placed]
+
+
+def _noop(*args: Any, **kwargs: Any) -> None:
+    return None
+
 
+class _NullDrawing:
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        return _noop
 
-def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image: Optional[bytes], theme_color: str) -> bytes:
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+
+class MeasureCanvas(_NullDrawing):
+    # Canevas sans sortie : même géométrie que le rendu PDF, aucun opérateur n'est émis.
+    def stringWidth(self, text: str, font_name: str, font_size: float) -> float:
+        return pdfmetrics.stringWidth(text, font_name, font_size)
+
+    def beginText(self, *args: Any, **kwargs: Any) -> _NullDrawing:
+        return _NullDrawing()
+
+    def beginPath(self) -> _NullDrawing:
+        return _NullDrawing()
+
+
+DEFAULT_PDF_FONT_FAMILY = "Helvetica"
+# Familles et verrou vivent dans le registre du processus : redéfinis à chaque rerun, ils oublieraient les
+# familles enregistrées et ne sérialiseraient pas les enregistrements concurrents de plusieurs sessions.
+PDF_FONT_FAMILIES: Dict[str, Tuple[str, str]] = _process_memo_registry().setdefault(
+    "pdf_font_families", {DEFAULT_PDF_FONT_FAMILY: ("Helvetica", "Helvetica-Bold")}
+)
+_TTF_LOCK = _process_memo_registry().setdefault("ttf_lock", threading.Lock())
+
+
+def _register_ttf(source: Union[str, bytes]) -> str:
+    if isinstance(source, (bytes, bytearray)):
+        font_name = "TTF-" + hashlib.blake2b(source, digest_size=8).hexdigest()
+    else:
+        stat = os.stat(source)
+        font_name = "TTF-" + hashlib.blake2b(f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"), digest_size=8).hexdigest()
+    # Le registre de ReportLab est global au processus : une police n'est analysée qu'une fois puis partagée
+    # par tous les rendus ; seuls les glyphes utilisés sont embarqués (sous-ensembles TrueType).
+    if font_name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font_name, io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source))
+    return font_name
+
+
+def register_pdf_font_family(family: str, regular: Union[str, bytes], bold: Optional[Union[str, bytes]] = None) -> str:
+    with _TTF_LOCK:
+        regular_name = _register_ttf(regular)
+        bold_name = _register_ttf(bold) if bold else regular_name
+        PDF_FONT_FAMILIES[family] = (regular_name, bold_name)
+    return family
+
+
+# Césure en temps linéaire : chaque mot est mesuré une seule fois et les mots plus larges que la colonne
+# sont coupés caractère par caractère à partir d'une table de largeurs de glyphes.
+MAX_WRAP_CHARS = 20_000
+WRAP_CACHE_MAX_CHARS = 2_000
+WRAP_CACHE_SIZE = 4096
+_GLYPH_WIDTHS: Dict[Tuple[str, float], Dict[str, float]] = _process_memo_registry().setdefault("glyph_widths", {})
+
+
+def _split_long_token(token: str, font_name: str, font_size: float, max_width: float) -> Tuple[List[str], float]:
+    widths = _GLYPH_WIDTHS.setdefault((font_name, font_size), {})
+    pieces: List[str] = []
+    start = 0
+    current_width = 0.0
+    for index, char in enumerate(token):
+        char_width = widths.get(char)
+        if char_width is None:
+            char_width = widths[char] = pdfmetrics.stringWidth(char, font_name, font_size)
+        if index > start and current_width + char_width > max_width:
+            pieces.append(token[start:index])
+            start = index
+            current_width = 0.0
+        current_width += char_width
+    pieces.append(token[start:])
+    return pieces, current_width
+
+
+def wrap_text(text: str, font_name: str, font_size: float, max_width: float) -> Tuple[str, ...]:
+    if len(text) > MAX_WRAP_CHARS:
+        text = text[:MAX_WRAP_CHARS] + "…"
+    if len(text) > WRAP_CACHE_MAX_CHARS:
+        return _wrap_text_linear(text, font_name, font_size, max_width)
+    return _wrap_text_cached(text, font_name, font_size, max_width)
+
+
+# Mémo partagé par toutes les sessions : seuls les textes courts y entrent, ce qui le borne à environ
+# WRAP_CACHE_SIZE × 2 × WRAP_CACHE_MAX_CHARS octets (≈ 16 Mo), dans le budget du cache partagé.
+@process_lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _wrap_text_cached(text: str, font_name: str, font_size: float, max_width: float) -> Tuple[str, ...]:
+    return _wrap_text_linear(text, font_name, font_size, max_width)
+
+
+def _wrap_text_linear(text: str, font_name: str, font_size: float, max_width: float) -> Tuple[str, ...]:
+    space_width = pdfmetrics.stringWidth(" ", font_name, font_size)
+    lines: List[str] = []
+    for paragraph in text.splitlines() or [text]:
+        current: List[str] = []
+        current_width = 0.0
+        for word in paragraph.split():
+            word_width = pdfmetrics.stringWidth(word, font_name, font_size)
+            if word_width > max_width:
+                if current:
+                    lines.append(" ".join(current))
+                pieces, word_width = _split_long_token(word, font_name, font_size, max_width)
+                lines.extend(pieces[:-1])
+                current, current_width = [pieces[-1]], word_width
+            elif current and current_width + space_width + word_width <= max_width:
+                current.append(word)
+                current_width += space_width + word_width
+            else:
+                if current:
+                    lines.append(" ".join(current))
+                current, current_width = [word], word_width
+        lines.append(" ".join(current))
+    return tuple(lines) or ("",)
+
+
+def stress_line_breaker(sizes: Tuple[int, ...] = (2_000, 20_000, 200_000)) -> Dict[str, List[Tuple[int, float]]]:
+    rng = random.Random(7)
+    cases: Dict[str, Callable[[int], str]] = {
+        "jeton géant": lambda n: "W" * n,
+        "URL sans espace": lambda n: ("https://exemple.fr/" + "chemin-tres-long/" * n)[:n],
+        "mots d’une lettre": lambda n: "a " * (n // 2),
+        "paragraphe collé": lambda n: " ".join(rng.choice(["ingénierie", "x", "pilotage", "EPR2", "coordination"]) for _ in range(n // 8))[:n],
+        "lignes vides": lambda n: "\n" * n,
+    }
+    report: Dict[str, List[Tuple[int, float]]] = {}
+    for label, build in cases.items():
+        timings: List[Tuple[int, float]] = []
+        for size in sizes:
+            text = build(size)
+            start = time.perf_counter()
+            _wrap_text_linear(text, "Helvetica", 9.5, 300.0)
+            timings.append((size, time.perf_counter() - start))
+        report[label] = timings
+    return report
+
+
+class PdfBytesSink:
+    # Collecte les blocs écrits par ReportLab sans les recopier dans un tampon intermédiaire.
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(data)
+        return len(data)
+
+    def getvalue(self) -> bytes:
+        if len(self._chunks) == 1:
+            return self._chunks[0]
+        return b"".join(self._chunks)
+
+
+def cv_to_pdf_bytes(
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    signature_image: Optional[bytes],
+    theme_color: str,
+    *,
+    exported_at: Optional[datetime] = None,
+    **pdf_options: Any,
+) -> bytes:
+    sink = PdfBytesSink()
+    write_cv_pdf(sink, cv, show_sections, signature_image, theme_color, exported_at=exported_at, **pdf_options)
+    return sink.getvalue()
+
+
+def write_cv_pdf_to_zip(
+    archive: zipfile.ZipFile,
+    arcname: str,
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    signature_image: Optional[bytes],
+    theme_color: str,
+    *,
+    exported_at: Optional[datetime] = None,
+    **pdf_options: Any,
+) -> None:
+    with archive.open(arcname, "w") as entry:
+        write_cv_pdf(entry, cv, show_sections, signature_image, theme_color, exported_at=exported_at, **pdf_options)
+
+
+@profile_on_demand("pdf")
+def write_cv_pdf(
+    sink: BinaryIO,
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    signature_image: Optional[bytes],
+    theme_color: str,
+    *,
+    exported_at: Optional[datetime] = None,
+    use_forms: bool = False,
+    compact: bool = False,
+    font_family: str = DEFAULT_PDF_FONT_FAMILY,
+    incremental: bool = False,
+) -> PageLayout:
+    # `sink` : tout objet avec une méthode write (fichier ouvert, socket.makefile("wb"), entrée ZIP...).
+    # Le document est écrit d'un seul bloc ; le sink n'est ni rembobiné ni fermé.
+    # `use_forms` : le bandeau et le fond de colonne deviennent des form XObjects définis une fois par document
+    # et par couleur. Le CV tenant sur une page, chaque form n'est utilisé qu'une fois : le PDF est un peu plus
+    # lourd qu'en mode direct. L'option n'est donc pas proposée dans l'interface.
+    # `compact` : flux compressés, badges regroupés en un seul tracé et textes regroupés par police/couleur.
+    # `font_family` : famille connue de PDF_FONT_FAMILIES (voir register_pdf_font_family).
+    # `incremental` : les blocs inchangés depuis un export précédent sont rejoués depuis le cache partagé
+    # (voir supports_incremental_pdf pour les combinaisons exclues).
+    font_regular, font_bold = PDF_FONT_FAMILIES.get(font_family, PDF_FONT_FAMILIES[DEFAULT_PDF_FONT_FAMILY])
+    c = canvas.Canvas(sink, pagesize=A4, pageCompression=1 if compact else None, initialFontName=font_regular)
+    fragments = None
+    if incremental and supports_incremental_pdf(font_regular, font_bold, use_forms=use_forms):
+        _check_incremental_pdf_internals(c)
+        fragments = get_shared_cache()
+        # Noms internes (/F1, /F2) fixés d'avance pour les deux polices du CV : un fragment rejoué référence
+        # les mêmes ressources qu'au moment de son enregistrement. Les polices de substitution ne sont pas
+        # réservées (elles seraient embarquées sans servir) : un bloc qui en déclenche une n'est pas mis en cache.
+        for font_name in (font_regular, font_bold):
+            c._doc.getInternalFontName(font_name)
+    layout = _draw_cv_page(
+        c,
+        cv,
+        show_sections,
+        signature_image,
+        theme_color,
+        exported_at=exported_at,
+        use_forms=use_forms,
+        compact=compact,
+        font_regular=font_regular,
+        font_bold=font_bold,
+        fragments=fragments,
+    )
+    c.showPage()
+    c.save()
+    return layout
+
+
+def _check_incremental_pdf_internals(c: Any) -> None:
+    # Le mode incrémental s'appuie sur des attributs privés de ReportLab : mieux vaut échouer franchement
+    # qu'émettre un PDF incohérent si une version future les modifie.
+    doc = getattr(c, "_doc", None)
+    if not (
+        isinstance(getattr(c, "_code", None), list)
+        and isinstance(getattr(doc, "fontMapping", None), dict)
+        and callable(getattr(doc, "getInternalFontName", None))
+    ):
+        raise RuntimeError(
+            "Réexport incrémental indisponible : la structure interne du canvas ReportLab a changé "
+            "(_code, _doc.fontMapping, _doc.getInternalFontName). Désactiver l'option « incremental »."
+        )
+
+
+def supports_incremental_pdf(font_regular: str, font_bold: str, *, use_forms: bool = False) -> bool:
+    # Les polices TrueType sont sous-ensemblées au fil du texte dessiné (codes de glyphes attribués à la volée)
+    # et les form XObjects sont définis une fois par document : leurs fragments ne sont pas rejouables.
+    if use_forms:
+        return False
+    return all(pdfmetrics.getFont(name).face.builtIn for name in (font_regular, font_bold))
+
+
+def measure_cv_layout(cv: CVData, show_sections: Dict[str, bool], *, font_family: str = DEFAULT_PDF_FONT_FAMILY) -> PageLayout:
+    font_regular, font_bold = PDF_FONT_FAMILIES.get(font_family, PDF_FONT_FAMILIES[DEFAULT_PDF_FONT_FAMILY])
+    return _draw_cv_page(
+        MeasureCanvas(),
+        cv,
+        show_sections,
+        None,
+        "",
+        exported_at=None,
+        use_forms=False,
+        compact=True,
+        font_regular=font_regular,
+        font_bold=font_bold,
+    )
+
+
+def _draw_cv_page(
+    c: Any,
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    signature_image: Optional[bytes],
+    theme_color: str,
+    *,
+    exported_at: Optional[datetime],
+    use_forms: bool,
+    compact: bool,
+    font_regular: str,
+    font_bold: str,
+    fragments: Optional[SharedCache] = None,
+) -> PageLayout:
     width, height = A4
 
     margin = 1.9 * cm
@@ -422,24 +1914,22 @@ def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image:
     muted = HexColor("#475569")
 
     def wrap_by_width(text: str, font_name: str, font_size: float, max_width: float) -> List[str]:
-        lines: List[str] = []
-        for paragraph in text.splitlines() or [text]:
-            words = paragraph.split()
-            if not words:
-                lines.append("")
-                continue
-            current = words[0]
-            for word in words[1:]:
-                test = f"{current} {word}"
-                if c.stringWidth(test, font_name, font_size) <= max_width:
-                    current = test
-                else:
-                    lines.append(current)
-                    current = word
-            lines.append(current)
-        return lines or [""]
+        return list(wrap_text(text, font_name, font_size, max_width))
+
+    def draw_text_runs(runs: List[Tuple[float, float, str]], *, font_name: str, font_size: float, color: HexColor) -> None:
+        # Un seul objet texte : police et couleur ne sont émises qu'une fois pour toute la série.
+        text = c.beginText()
+        text.setFont(font_name, font_size)
+        text.setFillColor(color)
+        for run_x, run_y, value in runs:
+            text.setTextOrigin(run_x, run_y)
+            text.textOut(value)
+        c.drawText(text)
 
     def draw_lines(lines: List[str], *, x: float, y: float, font_name: str, font_size: float, leading: float, color: HexColor) -> float:
+        if compact:
+            draw_text_runs([(x, y - idx * leading, line) for idx, line in enumerate(lines)], font_name=font_name, font_size=font_size, color=color)
+            return y - leading * len(lines)
         c.setFont(font_name, font_size)
         c.setFillColor(color)
         for line in lines:
@@ -447,18 +1937,66 @@ def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image:
             y -= leading
         return y
 
+    theme_key = accent.hexval()[2:]
+    defined_forms: set[str] = set()
+
+    def draw_furniture(name: str, draw: Callable[[float, float], None], *, x: float, y: float, w: float, h: float) -> None:
+        if not use_forms:
+            draw(x, y)
+            return
+        form_name = f"{name}_{theme_key}_{w:.1f}x{h:.1f}".replace(".", "_")
+        if form_name not in defined_forms:
+            c.beginForm(form_name, 0, 0, w, h)
+            draw(0, 0)
+            c.endForm()
+            defined_forms.add(form_name)
+        c.saveState()
+        c.translate(x, y)
+        c.doForm(form_name)
+        c.restoreState()
+
     def draw_section_label(label: str, *, x: float, y: float) -> float:
         badge_height = 16
-        badge_width = c.stringWidth(label.upper(), "Helvetica-Bold", 8) + 14
+        badge_width = c.stringWidth(label.upper(), font_bold, 8) + 14
+
+        # Pas de form XObject ici : chaque libellé a sa propre largeur, un form ne serait jamais réutilisé
+        # et ne ferait qu'ajouter un objet au document.
+        bottom = y - badge_height + 4
         c.setFillColor(accent)
-        c.roundRect(x, y - badge_height + 4, badge_width, badge_height, 6, fill=1, stroke=0)
+        c.roundRect(x, bottom, badge_width, badge_height, 6, fill=1, stroke=0)
         c.setFillColor(HexColor("#ffffff"))
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(x + 7, y - 4, label.upper())
+        c.setFont(font_bold, 8)
+        c.drawString(x + 7, bottom + badge_height - 8, label.upper())
         return y - badge_height - 6
 
+    column_floor = margin + 0.6 * cm
+    layout_blocks: List[LayoutBlock] = []
+    style_key = (theme_color, compact, font_regular, font_bold)
+    session_id = current_session_id() if fragments is not None else None
+
+    def fragment(kind: str, content: Any, top: float, draw: Callable[[], float]) -> float:
+        # Rendu incrémental : les opérateurs PDF émis par un bloc (tranche de c._code) sont rejoués tels quels
+        # quand son contenu, sa position et le style sont inchangés ; seuls les blocs modifiés ou décalés sont redessinés.
+        if fragments is None:
+            return draw()
+        key = "pdf-fragment:" + content_hash(kind, content, round(top, 3), style_key)
+        cached = fragments.get(key)
+        if cached is not None:
+            code, result = cached
+            c._code.extend(code)
+            return result
+        start = len(c._code)
+        fonts_before = len(c._doc.fontMapping)
+        result = draw()
+        if len(c._doc.fontMapping) == fonts_before:
+            fragments.put(key, (tuple(c._code[start:]), result), session_id=session_id)
+        return result
+
     def ensure_column_space(current_y: float, needed: float) -> bool:
-        return current_y - needed >= margin + 0.6 * cm
+        return current_y - needed >= column_floor
+
+    def record(section: str, key: str, label: str, column: str, top: float, bottom: float, placed: bool = True) -> None:
+        layout_blocks.append(LayoutBlock(section=section, key=key, label=label, column=column, top=top, bottom=bottom, placed=placed))
 
     def draw_badges(values: List[str], *, x: float, y: float, max_width: float) -> float:
         if not values:
@@ -468,31 +2006,50 @@ def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image:
         pad_x = 4
         pad_y = 2
         height_badge = 12
-        c.setFont("Helvetica", 7)
+        placed: List[Tuple[float, float, float, str]] = []
         for value in values:
-            text_width = c.stringWidth(value, "Helvetica", 7) + pad_x * 2
+            text_width = c.stringWidth(value, font_regular, 7) + pad_x * 2
             if current_x + text_width > x + max_width:
                 current_x = x
                 current_y -= height_badge + 4
-            c.setFillColor(accent)
-            c.roundRect(current_x, current_y - height_badge + pad_y, text_width, height_badge, 5, fill=1, stroke=0)
-            c.setFillColor(HexColor("#ffffff"))
-            c.drawString(current_x + pad_x, current_y - 4, value)
+            placed.append((current_x, current_y, text_width, value))
             current_x += text_width + 6
+        if compact:
+            shapes = c.beginPath()
+            for badge_x, badge_y, badge_width, _ in placed:
+                shapes.roundRect(badge_x, badge_y - height_badge + pad_y, badge_width, height_badge, 5)
+            c.setFillColor(accent)
+            c.drawPath(shapes, fill=1, stroke=0)
+            runs = [(badge_x + pad_x, badge_y - 4, value) for badge_x, badge_y, _, value in placed]
+            draw_text_runs(runs, font_name=font_regular, font_size=7, color=HexColor("#ffffff"))
+        else:
+            c.setFont(font_regular, 7)
+            for badge_x, badge_y, badge_width, value in placed:
+                c.setFillColor(accent)
+                c.roundRect(badge_x, badge_y - height_badge + pad_y, badge_width, height_badge, 5, fill=1, stroke=0)
+                c.setFillColor(HexColor("#ffffff"))
+                c.drawString(badge_x + pad_x, badge_y - 4, value)
         return current_y - height_badge - 6
 
     header_height = 92
-    c.setFillColor(accent)
-    c.roundRect(margin, height - margin - header_height, inner_width, header_height, 18, fill=1, stroke=0)
-    c.setFillColor(HexColor("#ffffff"))
-    c.setFont("Helvetica-Bold", 20)
-    c.drawString(margin + 18, height - margin - 28, cv.name)
-    c.setFont("Helvetica", 11)
-    c.drawString(margin + 18, height - margin - 46, cv.headline[:150])
-
-    contact_lines = wrap_by_width(delist([cv.location, cv.phone, cv.email, cv.linkedin] + cv.websites), "Helvetica", 9, inner_width - 36)
-    contact_y = height - margin - 62
-    contact_y = draw_lines(contact_lines, x=margin + 18, y=contact_y, font_name="Helvetica", font_size=9, leading=11, color=HexColor("#e0f2fe"))
+
+    def draw_header_band(left: float, bottom: float) -> None:
+        c.setFillColor(accent)
+        c.roundRect(left, bottom, inner_width, header_height, 18, fill=1, stroke=0)
+
+    contact_lines = wrap_by_width(delist([cv.location, cv.phone, cv.email, cv.linkedin] + cv.websites), font_regular, 9, inner_width - 36)
+
+    def draw_header() -> float:
+        draw_furniture("header", draw_header_band, x=margin, y=height - margin - header_height, w=inner_width, h=header_height)
+        c.setFillColor(HexColor("#ffffff"))
+        c.setFont(font_bold, 20)
+        c.drawString(margin + 18, height - margin - 28, cv.name)
+        c.setFont(font_regular, 11)
+        c.drawString(margin + 18, height - margin - 46, cv.headline[:150])
+        contact_y = height - margin - 62
+        return draw_lines(contact_lines, x=margin + 18, y=contact_y, font_name=font_regular, font_size=9, leading=11, color=HexColor("#e0f2fe"))
+
+    contact_y = fragment("header", (cv.name, cv.headline[:150], contact_lines), height - margin, draw_header)
 
     body_top = contact_y - 16
     main_x = margin
@@ -501,84 +2058,137 @@ def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image:
     y_side = body_top
 
     side_bg_top = body_top + 10
-    c.setFillColor(HexColor("#f0f9ff"))
-    c.roundRect(side_x - 10, margin, side_width + 20, side_bg_top - margin, 16, fill=1, stroke=0)
+
+    def draw_side_background(left: float, bottom: float) -> None:
+        c.setFillColor(HexColor("#f0f9ff"))
+        c.roundRect(left, bottom, side_width + 20, side_bg_top - margin, 16, fill=1, stroke=0)
+
+    def draw_side_furniture() -> float:
+        draw_furniture("side", draw_side_background, x=side_x - 10, y=margin, w=side_width + 20, h=side_bg_top - margin)
+        return side_bg_top
+
+    fragment("side-background", None, side_bg_top, draw_side_furniture)
 
     truncated = False
 
     if show_sections.get("Résumé", True) and cv.summary and not truncated:
-        lines = wrap_by_width(cv.summary, "Helvetica", 10, main_width)
+        lines = wrap_by_width(cv.summary, font_regular, 10, main_width)
         needed = 26 + len(lines) * 13
         if ensure_column_space(y_main, needed):
-            y_main = draw_section_label("Résumé", x=main_x, y=y_main)
-            y_main = draw_lines(lines, x=main_x, y=y_main, font_name="Helvetica", font_size=10, leading=13, color=neutral)
-            y_main -= 4
+            top = y_main
+
+            def draw_summary() -> float:
+                summary_y = draw_section_label("Résumé", x=main_x, y=top)
+                return draw_lines(lines, x=main_x, y=summary_y, font_name=font_regular, font_size=10, leading=13, color=neutral) - 4
+
+            y_main = fragment("summary", lines, top, draw_summary)
+            record("Résumé", "summary", "Résumé", "main", top, y_main)
         else:
             truncated = True
+            record("Résumé", "summary", "Résumé", "main", y_main, y_main, placed=False)
 
     if show_sections.get("Expériences", True) and cv.experiences and not truncated:
-        y_main = draw_section_label("Expériences", x=main_x, y=y_main)
-        y_main -= 4
-        for exp in cv.experiences:
+        top = y_main
+        y_main = fragment("label", "Expériences", top, lambda: draw_section_label("Expériences", x=main_x, y=top) - 4)
+        record("Expériences", "experiences", "Expériences", "main", top, y_main)
+        for exp_idx, exp in enumerate(cv.experiences):
             title = f"{exp.role} — {exp.org}".strip(" —")
-            title_lines = wrap_by_width(title, "Helvetica-Bold", 10.5, main_width)
-            date_lines = wrap_by_width(exp.dates, "Helvetica", 9, main_width)
-            bullets_lines = sum(len(wrap_by_width(bullet, "Helvetica", 9.5, main_width - 16)) for bullet in exp.bullets)
+            title_lines = wrap_by_width(title, font_bold, 10.5, main_width)
+            date_lines = wrap_by_width(exp.dates, font_regular, 9, main_width)
+            bullets_lines = sum(len(wrap_by_width(bullet, font_regular, 9.5, main_width - 16)) for bullet in exp.bullets)
             needed = (len(title_lines) * 12) + (len(date_lines) * 11) + max(bullets_lines, 1) * 12 + 14
             if exp.tags:
                 needed += 16
             if not ensure_column_space(y_main, needed):
                 truncated = True
+                for dropped_idx, dropped in enumerate(cv.experiences[exp_idx:], start=exp_idx):
+                    record("Expériences", f"exp:{dropped_idx}", dropped.role or dropped.org, "main", y_main, y_main, placed=False)
                 break
-            y_main = draw_lines(title_lines, x=main_x, y=y_main, font_name="Helvetica-Bold", font_size=10.5, leading=12.5, color=neutral)
-            y_main = draw_lines(date_lines, x=main_x, y=y_main, font_name="Helvetica", font_size=9, leading=11, color=muted)
-            for bullet in exp.bullets:
-                bullet_lines = wrap_by_width(bullet, "Helvetica", 9.5, main_width - 16)
-                c.setFont("Helvetica", 9.5)
-                c.setFillColor(neutral)
-                for idx, line in enumerate(bullet_lines):
-                    if idx == 0:
-                        c.drawString(main_x + 4, y_main, "•")
-                        c.drawString(main_x + 14, y_main, line)
-                    else:
-                        c.drawString(main_x + 14, y_main, line)
-                    y_main -= 12
-            y_main -= 2
-            if exp.tags:
-                y_main = draw_badges(exp.tags, x=main_x, y=y_main + 6, max_width=main_width)
-            y_main -= 6
+            top = y_main
+
+            def draw_experience() -> float:
+                entry_y = draw_lines(title_lines, x=main_x, y=top, font_name=font_bold, font_size=10.5, leading=12.5, color=neutral)
+                entry_y = draw_lines(date_lines, x=main_x, y=entry_y, font_name=font_regular, font_size=9, leading=11, color=muted)
+                bullet_runs: List[Tuple[float, float, str]] = []
+                for bullet in exp.bullets:
+                    bullet_lines = wrap_by_width(bullet, font_regular, 9.5, main_width - 16)
+                    if not compact:
+                        c.setFont(font_regular, 9.5)
+                        c.setFillColor(neutral)
+                    for idx, line in enumerate(bullet_lines):
+                        if idx == 0:
+                            bullet_runs.append((main_x + 4, entry_y, "•"))
+                        bullet_runs.append((main_x + 14, entry_y, line))
+                        if not compact:
+                            for run_x, run_y, value in bullet_runs:
+                                c.drawString(run_x, run_y, value)
+                            bullet_runs.clear()
+                        entry_y -= 12
+                if bullet_runs:
+                    draw_text_runs(bullet_runs, font_name=font_regular, font_size=9.5, color=neutral)
+                entry_y -= 2
+                if exp.tags:
+                    entry_y = draw_badges(exp.tags, x=main_x, y=entry_y + 6, max_width=main_width)
+                return entry_y - 6
+
+            y_main = fragment("experience", exp, top, draw_experience)
+            record("Expériences", f"exp:{exp_idx}", exp.role or exp.org, "main", top, y_main)
+    elif show_sections.get("Expériences", True) and cv.experiences:
+        for dropped_idx, dropped in enumerate(cv.experiences):
+            record("Expériences", f"exp:{dropped_idx}", dropped.role or dropped.org, "main", y_main, y_main, placed=False)
 
     if show_sections.get("Éducation", True) and cv.education and not truncated:
-        y_main = draw_section_label("Éducation", x=main_x, y=y_main)
-        y_main -= 2
-        for edu in cv.education:
+        top = y_main
+        y_main = fragment("label", "Éducation", top, lambda: draw_section_label("Éducation", x=main_x, y=top) - 2)
+        record("Éducation", "education", "Éducation", "main", top, y_main)
+        for edu_idx, edu in enumerate(cv.education):
             title = f"{edu.title} — {edu.school}".strip(" —")
-            title_lines = wrap_by_width(title, "Helvetica-Bold", 10.5, main_width)
-            date_lines = wrap_by_width(edu.dates, "Helvetica", 9, main_width)
+            title_lines = wrap_by_width(title, font_bold, 10.5, main_width)
+            date_lines = wrap_by_width(edu.dates, font_regular, 9, main_width)
             details_lines: List[str] = []
             if edu.details:
-                details_lines = wrap_by_width(edu.details, "Helvetica", 9.5, main_width)
+                details_lines = wrap_by_width(edu.details, font_regular, 9.5, main_width)
             needed = len(title_lines) * 12 + len(date_lines) * 11 + len(details_lines) * 12 + 18
             if not ensure_column_space(y_main, needed):
                 truncated = True
+                for dropped_idx, dropped in enumerate(cv.education[edu_idx:], start=edu_idx):
+                    record("Éducation", f"edu:{dropped_idx}", dropped.title or dropped.school, "main", y_main, y_main, placed=False)
                 break
-            y_main = draw_lines(title_lines, x=main_x, y=y_main, font_name="Helvetica-Bold", font_size=10.5, leading=12, color=neutral)
-            y_main = draw_lines(date_lines, x=main_x, y=y_main, font_name="Helvetica", font_size=9, leading=11, color=muted)
-            if details_lines:
-                y_main = draw_lines(details_lines, x=main_x, y=y_main, font_name="Helvetica", font_size=9.5, leading=12, color=neutral)
-            y_main -= 6
+            top = y_main
+
+            def draw_education() -> float:
+                entry_y = draw_lines(title_lines, x=main_x, y=top, font_name=font_bold, font_size=10.5, leading=12, color=neutral)
+                entry_y = draw_lines(date_lines, x=main_x, y=entry_y, font_name=font_regular, font_size=9, leading=11, color=muted)
+                if details_lines:
+                    entry_y = draw_lines(details_lines, x=main_x, y=entry_y, font_name=font_regular, font_size=9.5, leading=12, color=neutral)
+                return entry_y - 6
+
+            y_main = fragment("education", edu, top, draw_education)
+            record("Éducation", f"edu:{edu_idx}", edu.title or edu.school, "main", top, y_main)
+    elif show_sections.get("Éducation", True) and cv.education:
+        for dropped_idx, dropped in enumerate(cv.education):
+            record("Éducation", f"edu:{dropped_idx}", dropped.title or dropped.school, "main", y_main, y_main, placed=False)
 
     def render_side_block(title: str, content_lines: List[str], *, font_size: float = 9.5, leading: float = 12) -> None:
         nonlocal y_side, truncated
-        if truncated or not content_lines:
+        if not content_lines:
+            return
+        if truncated:
+            record(title, title, title, "side", y_side, y_side, placed=False)
             return
         needed = 28 + len(content_lines) * leading
         if not ensure_column_space(y_side, needed):
             truncated = True
+            record(title, title, title, "side", y_side, y_side, placed=False)
             return
-        y_side = draw_section_label(title, x=side_x, y=y_side)
-        y_side = draw_lines(content_lines, x=side_x, y=y_side, font_name="Helvetica", font_size=font_size, leading=leading, color=neutral)
-        y_side -= 8
+        top = y_side
+
+        def draw_side_block() -> float:
+            block_y = draw_section_label(title, x=side_x, y=top)
+            return draw_lines(content_lines, x=side_x, y=block_y, font_name=font_regular, font_size=font_size, leading=leading, color=neutral) - 8
+
+        y_side = fragment(f"side:{title}", (content_lines, font_size, leading), top, draw_side_block)
+        record(title, title, title, "side", top, y_side)
 
     if show_sections.get("Compétences", True):
         blocks = [
@@ -589,24 +2199,32 @@ def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image:
         content: List[str] = []
         for label, values in blocks:
             if values:
-                content.extend(wrap_by_width(f"{label} : {values}", "Helvetica", 9.5, side_width))
+                content.extend(wrap_by_width(f"{label} : {values}", font_regular, 9.5, side_width))
         render_side_block("Compétences", content)
 
     if show_sections.get("Intérêts", False) and cv.interests:
-        render_side_block("Centres d’intérêt", wrap_by_width(delist(cv.interests), "Helvetica", 9.5, side_width))
+        render_side_block("Centres d’intérêt", wrap_by_width(delist(cv.interests), font_regular, 9.5, side_width))
 
     if show_sections.get("Mots-clés", False) and cv.keywords:
         if not truncated:
             needed = 30
             if not ensure_column_space(y_side, needed):
                 truncated = True
+                record("Mots-clés", "Mots-clés", "Mots-clés", "side", y_side, y_side, placed=False)
             else:
-                y_side = draw_section_label("Mots-clés", x=side_x, y=y_side)
-                y_side = draw_badges(cv.keywords, x=side_x, y=y_side + 10, max_width=side_width)
+                top = y_side
+
+                def draw_keywords() -> float:
+                    return draw_badges(cv.keywords, x=side_x, y=draw_section_label("Mots-clés", x=side_x, y=top) + 10, max_width=side_width)
+
+                y_side = fragment("keywords", cv.keywords, top, draw_keywords)
+                record("Mots-clés", "Mots-clés", "Mots-clés", "side", top, y_side)
+        else:
+            record("Mots-clés", "Mots-clés", "Mots-clés", "side", y_side, y_side, placed=False)
 
     if truncated:
         c.setFillColor(HexColor("#dc2626"))
-        c.setFont("Helvetica", 8.5)
+        c.setFont(font_regular, 8.5)
         c.drawString(margin, margin + 0.5 * cm, "Contenu réduit pour conserver une seule page. Ajuste les sections ou retire des expériences.")
 
     if signature_image:
@@ -616,52 +2234,83 @@ def cv_to_pdf_bytes(cv: CVData, show_sections: Dict[str, bool], signature_image:
             img_h = 1.8 * cm
             c.drawImage(img, width - margin - img_w, margin + 1.4 * cm, img_w, img_h, mask="auto")
             c.setFillColor(muted)
-            c.setFont("Helvetica", 8)
+            c.setFont(font_regular, 8)
             c.drawString(width - margin - img_w, margin + 1.1 * cm, "Signé électroniquement")
         except Exception:
             pass
 
     c.setFillColor(muted)
-    c.setFont("Helvetica", 8)
-    c.drawString(margin, margin, f"Exporté le {datetime.now().strftime('%d/%m/%Y %H:%M')} – Généré avec Streamlit")
+    c.setFont(font_regular, 8)
+    exported_at = exported_at or datetime.now()
+    c.drawString(margin, margin, f"Exporté le {exported_at.strftime(EXPORT_STAMP_FORMAT)} – Généré avec Streamlit")
 
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer.read()
+    return PageLayout(
+        body_top=body_top,
+        body_bottom=column_floor,
+        main_bottom=y_main,
+        side_bottom=y_side,
+        truncated=truncated,
+        blocks=layout_blocks,
+    )
 
 
-def cv_to_html(cv: CVData, show_sections: Dict[str, bool]) -> bytes:
-    page_html = build_preview_html(cv, show_sections, include_wrapper=True)
-    document = f"""<!DOCTYPE html>
-<html lang=\"fr\">
-<head>
-<meta charset=\"utf-8\">
-<title>CV - {escape(cv.name)}</title>
-{CSS}
-<style>
-body {{
-  background: #f8fafc;
-  margin: 0;
-  padding: 32px 0;
-  font-family: \"Inter\", -apple-system, BlinkMacSystemFont, \"Segoe UI\", sans-serif;
-}}
-main {{
-  display: flex;
-  justify-content: center;
-  padding: 0 24px;
-}}
-@page {{ size: A4; margin: 12mm; }}
-</style>
-</head>
-<body>
-<main>{page_html}</main>
-</body>
-</html>
-"""
+def cv_to_html(
+    cv: CVData, show_sections: Dict[str, bool], *, theme_color: Optional[str] = None, minify: bool = False
+) -> bytes:
+    # En mode minifié, seules les règles CSS dont les classes apparaissent dans la page sont embarquées.
+    page_html = build_preview_html(cv, show_sections, include_wrapper=True, minify=minify)
+    if minify:
+        styles = f"<style>{used_css(theme_color, _html_classes(page_html))}</style>"
+    else:
+        styles = themed_stylesheet(theme_color)
+    document = compile_html_templates(minify)["document"].substitute(name=escape(cv.name), styles=styles, page=page_html)
     return document.encode("utf-8")
 
 
+def cached_cv_pdf(
+    cv: CVData, show_sections: Dict[str, bool], signature_image: Optional[bytes], theme_color: str, **pdf_options: Any
+) -> bytes:
+    exported_at = datetime.now()
+    key = "pdf:" + content_hash(
+        cv, show_sections, signature_image, theme_color, pdf_options, exported_at.strftime(EXPORT_STAMP_FORMAT)
+    )
+    return get_shared_cache().get_or_create(
+        key, lambda: cv_to_pdf_bytes(cv, show_sections, signature_image, theme_color, exported_at=exported_at, **pdf_options)
+    )
+
+
+def compare_pdf_output_modes(
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    signature_image: Optional[bytes],
+    theme_color: str,
+    *,
+    repeat: int = 3,
+    **pdf_options: Any,
+) -> Dict[str, Dict[str, float]]:
+    exported_at = datetime.now()
+    report: Dict[str, Dict[str, float]] = {}
+    for mode, compact in (("standard", False), ("compact", True)):
+        options = {**pdf_options, "compact": compact}
+        timings: List[float] = []
+        size = 0
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            size = len(cv_to_pdf_bytes(cv, show_sections, signature_image, theme_color, exported_at=exported_at, **options))
+            timings.append(time.perf_counter() - start)
+        report[mode] = {"bytes": size, "seconds": min(timings)}
+    return report
+
+
+def cached_cv_html(
+    cv: CVData, show_sections: Dict[str, bool], *, theme_color: Optional[str] = None, minify: bool = False
+) -> bytes:
+    return get_shared_cache().get_or_create(
+        "html:" + content_hash(cv, show_sections, theme_color, minify),
+        lambda: cv_to_html(cv, show_sections, theme_color=theme_color, minify=minify),
+    )
+
+
 # ====== UI BUILDERS ======
 SECTION_DEFAULTS = [
     ("Résumé", True),
@@ -680,25 +2329,99 @@ def render_sidebar() -> Dict[str, Any]:
 
     if st.sidebar.button("Réordonner selon le preset"):
         apply_preset_to_state(preset)
-        st.experimental_rerun()
+        rerun()
 
     if st.sidebar.button("Réinitialiser le CV complet"):
         reset_state()
-        st.experimental_rerun()
+        rerun()
 
-    theme_color = st.sidebar.color_picker("Couleur d’accent (PDF)", value="#0F766E")
-    hide_sections = set(preset.get("hide_sections", []))
+    # Rempli par render_history_controls en fin de passe, une fois les saisies de la passe historisées.
+    history_slot = st.sidebar.container()
+
+    with st.sidebar.expander("💾 Instantané de session"):
+        in_url = st.checkbox(
+            "Recopier dans l’adresse de la page",
+            key=SESSION_URL_STATE_KEY,
+            help="Un rafraîchissement restaure alors la session, mais l’adresse contient tout le profil (coordonnées comprises) "
+            "et se retrouve dans l’historique du navigateur.",
+        )
+        token = st.session_state.get("session_token", "")
+        if token:
+            if not in_url:
+                where = "à copier pour restaurer la session plus tard."
+            elif len(token) <= SESSION_URL_MAX_CHARS:
+                where = "repris dans l’adresse de la page : un rafraîchissement restaure la session."
+            else:
+                where = "trop long pour l’adresse, à copier."
+            st.caption(f"{len(token)} caractères – {where}")
+            st.code(token, language=None)
+        pasted = st.text_input("Restaurer un instantané", key="session_token_input", placeholder="Coller un jeton…")
+        if st.button("Restaurer", disabled=not pasted.strip()):
+            try:
+                restore_session_token(pasted)
+            except ValueError as exc:
+                st.error(str(exc))
+            else:
+                rerun()
+
+    theme_color = st.sidebar.color_picker("Couleur d’accent (PDF & HTML)", value="#0F766E")
+    preset_sections = default_sections_for_preset(preset)
     show_sections: Dict[str, bool] = {}
-    for label, default in SECTION_DEFAULTS:
-        show_sections[label] = st.sidebar.checkbox(label, value=(label not in hide_sections and default))
+    for label, _ in SECTION_DEFAULTS:
+        show_sections[label] = st.sidebar.checkbox(label, value=preset_sections[label])
 
     uploaded_signature = st.sidebar.file_uploader(
         "Signature (PNG/JPG sur fond transparent de préférence)", type=["png", "jpg", "jpeg"]
     )
     signature_bytes = uploaded_signature.read() if uploaded_signature else None
 
+    with st.sidebar.expander("Options avancées du PDF"):
+        pdf_options: Dict[str, Any] = {
+            "compact": st.checkbox(
+                "Sortie compacte (flux compressés, badges et textes regroupés)",
+                value=False,
+                help="Moins d’opérateurs par badge et par ligne ; les flux sont déjà compressés par défaut, le gain en taille reste faible (voir « Comparer » dans l’export).",
+            ),
+            "incremental": st.checkbox(
+                "Réexport incrémental",
+                value=False,
+                help="Les blocs inchangés depuis le dernier export sont réutilisés tels quels (quelques ms gagnées par export) ; sans effet avec une police TrueType.",
+            ),
+        }
+        font_regular = st.file_uploader("Police TrueType (normale)", type=["ttf"], help="Par exemple Inter-Regular.ttf, pour aligner le PDF sur l’aperçu.")
+        font_bold = st.file_uploader("Police TrueType (grasse, optionnelle)", type=["ttf"])
+        if font_regular:
+            regular_bytes = font_regular.getvalue()
+            bold_bytes = font_bold.getvalue() if font_bold else None
+            family = "ttf-" + content_hash(regular_bytes, bold_bytes)[:12]
+            try:
+                pdf_options["font_family"] = register_pdf_font_family(family, regular_bytes, bold_bytes)
+            except Exception as exc:
+                st.warning(f"Police TrueType illisible, Helvetica est conservée ({exc}).")
+
+    with st.sidebar.expander("🩺 Diagnostic de performance"):
+        target = st.radio(
+            "Capturer (cProfile + tracemalloc)", list(PROFILE_TARGETS), format_func=PROFILE_TARGETS.get, key="profile_target"
+        )
+        # Pas de rerun ici : la passe qui suit l'armement doit être celle déclenchée par la prochaine action.
+        if "profile_request" in st.session_state:
+            if st.button("Annuler la capture"):
+                st.session_state.pop("profile_request")
+        elif st.button("Armer la capture", help="Le rapport liste les fonctions les plus coûteuses et les principaux sites d’allocation."):
+            st.session_state["profile_request"] = target
+        if "profile_request" in st.session_state:
+            st.caption(f"Capture armée : {PROFILE_TARGETS[st.session_state['profile_request']].lower()}.")
+        for report in reversed(st.session_state.get("profile_reports", [])):
+            render_profile_report_download(report)
+
     st.sidebar.write("---")
     st.sidebar.caption("Astuce : coche/décoche les sections à inclure dans l’export PDF.")
+    cache = get_shared_cache()
+    cache_stats = cache.stats()
+    st.sidebar.caption(
+        f"Cache partagé : {cache_stats['total_bytes'] / 1024:.0f} Ko / {cache_stats['max_bytes'] / 1024 / 1024:.0f} Mo "
+        f"({cache_stats['entries']} éléments, {cache_stats['sessions']} sessions) – cette session : {cache.session_usage() / 1024:.0f} Ko"
+    )
 
     return {
         "preset_name": preset_name,
@@ -706,20 +2429,54 @@ def render_sidebar() -> Dict[str, Any]:
         "theme_color": theme_color,
         "show_sections": show_sections,
         "signature": signature_bytes,
+        "pdf_options": pdf_options,
+        "history_slot": history_slot,
     }
 
 
+def render_history_controls(slot: Any) -> None:
+    history: UndoHistory = st.session_state["history"]
+    with slot:
+        undo_col, redo_col = st.columns(2)
+        if undo_col.button("↩️ Annuler", disabled=not history.past):
+            restore_snapshot(history.undo())
+            rerun()
+        if redo_col.button("↪️ Rétablir", disabled=not history.future):
+            restore_snapshot(history.redo())
+            rerun()
+        st.caption(f"Historique : {len(history.past)} étape(s) annulable(s), ~{history.memory_bytes() / 1024:.0f} Ko en mémoire.")
+
+
+def store_profile_report(report: Optional[ProfileReport]) -> None:
+    if report:
+        reports = st.session_state.setdefault("profile_reports", [])
+        reports.append(report)
+        del reports[:-PROFILE_MAX_REPORTS]
+
+
+def render_profile_report_download(report: ProfileReport) -> None:
+    st.download_button(
+        f"⬇️ {PROFILE_TARGETS[report.target]} – {report.elapsed * 1000:.0f} ms",
+        data=report.text.encode("utf-8"),
+        file_name=report.file_name,
+        mime="text/plain",
+        key=f"profile_report_{report.file_name}",
+        help=f"Capturé à {report.captured_at:%H:%M:%S}, pic mémoire {report.peak_bytes / 1024 / 1024:.1f} Mo.",
+    )
+
+
 def render_general_information(preset: Dict[str, Any]) -> None:
     general = st.session_state["cv_general"]
     colA, colB = st.columns([1.25, 1])
 
     with colA:
         st.subheader("📝 Infos générales")
-        general["name"] = st.text_input("Nom complet", general["name"])
-        general["headline_base"] = st.text_input("Accroche (headline)", general["headline_base"])
+        general["name"] = st.text_input("Nom complet", general["name"], key="general_name")
+        general["headline_base"] = st.text_input("Accroche (headline)", general["headline_base"], key="general_headline_base")
         use_suffix = st.checkbox(
             "Appliquer automatiquement le suffixe du preset",
             value=general.get("use_preset_headline", True),
+            key="general_use_preset_headline",
             help="Le suffixe varie selon la déclinaison ciblée.",
         )
         general["use_preset_headline"] = use_suffix
@@ -729,53 +2486,58 @@ def render_general_information(preset: Dict[str, Any]) -> None:
             if suffix:
                 st.caption(f"Suffixe appliqué : {suffix}")
         else:
-            general["headline"] = st.text_input("Accroche finale", general.get("headline", general["headline_base"]))
-        general["summary"] = st.text_area("Résumé (profil)", general["summary"], height=130)
+            general["headline"] = st.text_input("Accroche finale", general.get("headline", general["headline_base"]), key="general_headline")
+        general["summary"] = st.text_area("Résumé (profil)", general["summary"], height=130, key="general_summary")
 
         c1, c2, c3 = st.columns(3)
         with c1:
-            general["location"] = st.text_input("Localisation", general["location"])
+            general["location"] = st.text_input("Localisation", general["location"], key="general_location")
         with c2:
-            general["phone"] = st.text_input("Téléphone", general["phone"])
+            general["phone"] = st.text_input("Téléphone", general["phone"], key="general_phone")
         with c3:
-            general["email"] = st.text_input("Email", general["email"])
+            general["email"] = st.text_input("Email", general["email"], key="general_email")
 
-        general["linkedin"] = st.text_input("LinkedIn", general["linkedin"])
-        websites_input = st.text_input("Sites (séparés par virgule ou retour)", format_list(general["websites"]))
+        general["linkedin"] = st.text_input("LinkedIn", general["linkedin"], key="general_linkedin")
+        websites_input = st.text_input("Sites (séparés par virgule ou retour)", format_list(general["websites"]), key="general_websites")
         general["websites"] = parse_free_list(websites_input)
 
     with colB:
         st.subheader("🧩 Compétences & plus")
         general["languages"] = parse_free_list(
-            st.text_area("Langues", format_list(general["languages"]), height=70, help="Utilise virgules ou retours à la ligne.")
+            st.text_area("Langues", format_list(general["languages"]), height=70, key="general_languages", help="Utilise virgules ou retours à la ligne.")
         )
         general["softskills"] = parse_free_list(
-            st.text_area("Soft skills", format_list(general["softskills"]), height=90)
+            st.text_area("Soft skills", format_list(general["softskills"]), height=90, key="general_softskills")
         )
         general["tools"] = parse_free_list(
-            st.text_area("Outils", format_list(general["tools"]), height=90)
+            st.text_area("Outils", format_list(general["tools"]), height=90, key="general_tools")
         )
         general["interests"] = parse_free_list(
-            st.text_area("Centres d’intérêt", format_list(general["interests"]), height=70)
+            st.text_area("Centres d’intérêt", format_list(general["interests"]), height=70, key="general_interests")
         )
         general["keywords"] = parse_free_list(
-            st.text_area("Mots-clés principaux", format_list(general["keywords"]), height=90)
+            st.text_area("Mots-clés principaux", format_list(general["keywords"]), height=90, key="general_keywords")
         )
         general["use_preset_keywords"] = st.checkbox(
             "Ajouter les mots-clés suggérés par le preset",
             value=general.get("use_preset_keywords", True),
+            key="general_use_preset_keywords",
             help="Fusionne tes mots-clés avec ceux recommandés pour la cible.",
         )
         if preset.get("extra_keywords"):
             st.caption("Suggestions du preset : " + ", ".join(preset["extra_keywords"]))
 
 
-def render_experience_manager() -> None:
+def render_experience_manager() -> Dict[str, Any]:
     st.markdown('<div class="rule"></div>', unsafe_allow_html=True)
     st.subheader("🏗️ Expériences")
+    # Emplacements remplis par render_page_budget une fois toutes les saisies de la passe prises en compte.
+    budget_slots: Dict[str, Any] = {"overview": st.empty()}
     experiences = st.session_state["experiences"]
     if not experiences:
         st.info("Ajoute ta première expérience professionnelle.")
+    else:
+        render_period_controls(st.session_state["cv_general"], experiences)
     to_delete: List[int] = []
     for idx, exp in enumerate(experiences):
         header_parts = [exp.get("role", ""), exp.get("org", "")]
@@ -792,16 +2554,17 @@ def render_experience_manager() -> None:
             )
             if col_ctrl[1].button("⬆️", key=f"{exp['uid']}_up") and idx > 0:
                 experiences[idx - 1], experiences[idx] = experiences[idx], experiences[idx - 1]
-                st.experimental_rerun()
+                rerun()
             if col_ctrl[2].button("⬇️", key=f"{exp['uid']}_down") and idx < len(experiences) - 1:
                 experiences[idx + 1], experiences[idx] = experiences[idx], experiences[idx + 1]
-                st.experimental_rerun()
+                rerun()
             if col_ctrl[3].button("🗑️", key=f"{exp['uid']}_delete"):
                 to_delete.append(idx)
+            budget_slots[exp["uid"]] = st.empty()
 
             exp["role"] = st.text_input("Intitulé du poste", exp["role"], key=f"{exp['uid']}_role")
             exp["org"] = st.text_input("Organisation", exp["org"], key=f"{exp['uid']}_org")
-            exp["dates"] = st.text_input("Période", exp["dates"], key=f"{exp['uid']}_dates")
+            set_entry_dates(exp, st.text_input("Période", exp["dates"], key=f"{exp['uid']}_dates"))
             bullets_text = st.text_area(
                 "Points clés (une ligne = un point)",
                 "\n".join(exp.get("bullets", [])),
@@ -818,7 +2581,9 @@ def render_experience_manager() -> None:
     if to_delete:
         for index in sorted(to_delete, reverse=True):
             experiences.pop(index)
-        st.experimental_rerun()
+        rerun()
+
+    render_duplicate_bullets(experiences)
 
     with st.expander("➕ Ajouter une expérience"):
         with st.form("add_experience_form"):
@@ -838,6 +2603,7 @@ def render_experience_manager() -> None:
                         "role": new_role.strip(),
                         "org": new_org.strip(),
                         "dates": new_dates.strip(),
+                        **period_fields(new_dates.strip()),
                         "bullets": [b.strip() for b in new_bullets.splitlines() if b.strip()],
                         "tags": parse_free_list(new_tags),
                         "enabled": True,
@@ -846,7 +2612,115 @@ def render_experience_manager() -> None:
                 for key in ["new_exp_role", "new_exp_org", "new_exp_dates", "new_exp_bullets", "new_exp_tags"]:
                     st.session_state.pop(key, None)
                 st.success("Expérience ajoutée.")
-                st.experimental_rerun()
+                rerun()
+
+    return budget_slots
+
+
+def render_profile_search(slot: Any) -> None:
+    index: SearchIndex = st.session_state.setdefault("search_index", SearchIndex())
+    index.sync("experiences", st.session_state["experiences"])
+    index.sync("education", st.session_state["education"])
+    with slot:
+        query = st.text_input(
+            "🔎 Rechercher dans le profil",
+            key="profile_search",
+            placeholder="ex. : dimension, béton arm, EPR…",
+            help="Intitulés, organisations, points clés, tags et détails de formation. Accents et majuscules ignorés, préfixes acceptés.",
+        )
+        if not query.strip():
+            return
+        started = time.perf_counter()
+        hits = index.search(query)
+        elapsed = time.perf_counter() - started
+        st.caption(f"{len(hits)} résultat(s) en {elapsed * 1000:.1f} ms sur {len(index.documents)} champs indexés.")
+        entries = {entry["uid"]: entry for entry in st.session_state["experiences"] + st.session_state["education"]}
+        field_labels = {"role": "Intitulé", "org": "Organisation", "tags": "Tags", "bullets": "Point clé", "details": "Détails"}
+        for hit in hits:
+            entry = entries.get(hit.uid, {})
+            if hit.kind == "education":
+                origin = entry.get("title") or "Formation"
+            else:
+                origin = " — ".join(part for part in [entry.get("role", ""), entry.get("org", "")] if part) or "Expérience"
+            st.markdown(
+                f"- {highlight_matches(hit.text, query)}  \n  <span class=\"small muted\">{escape(origin)} · {field_labels[hit.field]}</span>",
+                unsafe_allow_html=True,
+            )
+
+
+def render_period_controls(general: Dict[str, Any], experiences: List[Dict[str, Any]]) -> None:
+    col_sort, col_years = st.columns([1, 2])
+    if col_sort.button("📅 Trier par date", key="sort_experiences_by_date", help="Du plus récent au plus ancien."):
+        st.session_state["experiences"] = sort_entries_chronologically(experiences)
+        rerun()
+    general["recent_years"] = col_years.number_input(
+        "Limiter le CV aux N dernières années (0 = tout)",
+        min_value=0,
+        max_value=60,
+        value=int(general.get("recent_years", 0)),
+        step=1,
+    )
+    index = PeriodIndex.from_entries(experiences)
+    enabled = np.fromiter((exp.get("enabled", True) for exp in experiences), bool, len(experiences))
+    included = enabled
+    if general["recent_years"]:
+        included = enabled & index.active_since(current_month() - 12 * general["recent_years"])
+    caption = f"Expérience cumulée (chevauchements comptés une fois) : {format_duration(index.total_months(enabled))}"
+    if general["recent_years"]:
+        caption += f" · {int(enabled.sum() - included.sum())} expérience(s) antérieure(s) masquée(s) par le filtre"
+    st.caption(caption)
+
+
+def render_page_budget(layout: PageLayout, budget_slots: Dict[str, Any], included_uids: List[str]) -> None:
+    available = layout.body_top - layout.body_bottom
+    consumed: Dict[Tuple[str, str], float] = {}
+    for block in layout.blocks:
+        if block.placed:
+            consumed[(block.column, block.section)] = consumed.get((block.column, block.section), 0.0) + block.height
+    with budget_slots["overview"].container():
+        st.markdown("**📏 Budget d’une page**")
+        for column, label in (("main", "Colonne principale"), ("side", "Colonne latérale")):
+            ratio = min(max(layout.fill_ratio(column), 0.0), 1.0)
+            st.progress(ratio)
+            details = [f"{section} {height / available:.0%}" for (block_column, section), height in consumed.items() if block_column == column]
+            st.caption(f"{label} : {ratio:.0%}" + (" – " + " · ".join(details) if details else ""))
+        dropped = layout.dropped
+        if dropped:
+            labels = [block.section if block.label == block.section else f"{block.section} – {block.label}" for block in dropped]
+            st.error("✂️ Coupé à l’export : " + ", ".join(labels))
+        else:
+            st.caption("✅ Tout le contenu tient sur une page.")
+    for block in layout.blocks:
+        if not block.key.startswith("exp:"):
+            continue
+        slot = budget_slots.get(included_uids[int(block.key[4:])])
+        if slot is None:
+            continue
+        if block.placed:
+            slot.caption(f"📏 Occupe {block.height / available:.0%} de la colonne principale.")
+        else:
+            slot.warning("✂️ Cette expérience sera coupée à l’export : libère de la place au-dessus ou masque une section.")
+
+
+def render_duplicate_bullets(experiences: List[Dict[str, Any]]) -> None:
+    refs = [(exp_idx, bullet_idx) for exp_idx, exp in enumerate(experiences) for bullet_idx in range(len(exp.get("bullets", [])))]
+    texts = tuple(experiences[exp_idx]["bullets"][bullet_idx] for exp_idx, bullet_idx in refs)
+    clusters = find_near_duplicate_bullets(texts)
+    if not clusters:
+        return
+    with st.expander(f"♻️ Points clés en doublon probable ({len(clusters)})"):
+        st.caption("Groupes de points quasi identiques entre expériences. La fusion conserve la formulation la plus longue à la première position.")
+        for cluster_idx, cluster in enumerate(clusters[:MAX_DUPLICATE_CLUSTERS_SHOWN]):
+            for member in cluster:
+                exp_idx, _ = refs[member]
+                origin = experiences[exp_idx].get("role") or f"Expérience #{exp_idx + 1}"
+                st.markdown(f"- **{escape(origin)}** : {escape(texts[member])}")
+            cluster_key = zlib.crc32("\n".join(texts[member] for member in cluster).encode("utf-8"))
+            if st.button("Fusionner ce groupe", key=f"dup_merge_{cluster_idx}_{cluster_key}"):
+                merge_bullet_cluster(experiences, [refs[member] for member in cluster])
+                rerun()
+        if len(clusters) > MAX_DUPLICATE_CLUSTERS_SHOWN:
+            st.caption(f"… et {len(clusters) - MAX_DUPLICATE_CLUSTERS_SHOWN} autres groupes.")
 
 
 def render_education_manager() -> None:
@@ -855,6 +2729,9 @@ def render_education_manager() -> None:
     education = st.session_state["education"]
     if not education:
         st.info("Ajoute ton parcours académique.")
+    elif st.button("📅 Trier par date", key="sort_education_by_date", help="Du plus récent au plus ancien."):
+        st.session_state["education"] = sort_entries_chronologically(education)
+        rerun()
     to_delete: List[int] = []
     for idx, edu in enumerate(education):
         header = edu.get("title") or f"Formation #{idx + 1}"
@@ -872,21 +2749,21 @@ def render_education_manager() -> None:
             )
             if col_ctrl[1].button("⬆️", key=f"{edu['uid']}_edu_up") and idx > 0:
                 education[idx - 1], education[idx] = education[idx], education[idx - 1]
-                st.experimental_rerun()
+                rerun()
             if col_ctrl[2].button("⬇️", key=f"{edu['uid']}_edu_down") and idx < len(education) - 1:
                 education[idx + 1], education[idx] = education[idx], education[idx + 1]
-                st.experimental_rerun()
+                rerun()
             if col_ctrl[3].button("🗑️", key=f"{edu['uid']}_edu_delete"):
                 to_delete.append(idx)
 
             edu["title"] = st.text_input("Intitulé", edu["title"], key=f"{edu['uid']}_title")
             edu["school"] = st.text_input("Établissement", edu["school"], key=f"{edu['uid']}_school")
-            edu["dates"] = st.text_input("Période", edu["dates"], key=f"{edu['uid']}_dates")
+            set_entry_dates(edu, st.text_input("Période", edu["dates"], key=f"{edu['uid']}_dates"))
             edu["details"] = st.text_area("Détails", edu.get("details", ""), key=f"{edu['uid']}_details", height=120)
     if to_delete:
         for index in sorted(to_delete, reverse=True):
             education.pop(index)
-        st.experimental_rerun()
+        rerun()
 
     with st.expander("➕ Ajouter une formation"):
         with st.form("add_education_form"):
@@ -901,6 +2778,7 @@ def render_education_manager() -> None:
                         "title": new_title.strip(),
                         "school": new_school.strip(),
                         "dates": new_dates.strip(),
+                        **period_fields(new_dates.strip()),
                         "details": new_details.strip(),
                         "enabled": True,
                     }
@@ -908,11 +2786,26 @@ def render_education_manager() -> None:
                 for key in ["new_edu_title", "new_edu_school", "new_edu_dates", "new_edu_details"]:
                     st.session_state.pop(key, None)
                 st.success("Formation ajoutée.")
-                st.experimental_rerun()
+                rerun()
 
 
 def build_cv(preset: Dict[str, Any]) -> CVData:
-    general = st.session_state["cv_general"]
+    return build_cv_from_state(st.session_state["cv_general"], st.session_state["experiences"], st.session_state["education"], preset)
+
+
+def build_preset_variant(
+    general: Dict[str, Any], experiences: List[Dict[str, Any]], education: List[Dict[str, Any]], preset: Dict[str, Any]
+) -> CVData:
+    variant_general = dict(general)
+    if general.get("use_preset_headline", True):
+        variant_general["headline"] = general["headline_base"] + preset.get("headline_addon", "")
+    ranked = [dict(exp, enabled=enabled) for exp, enabled in rank_experiences_for_preset(experiences, preset)]
+    return build_cv_from_state(variant_general, ranked, education, preset)
+
+
+def build_cv_from_state(
+    general: Dict[str, Any], experiences: List[Dict[str, Any]], education: List[Dict[str, Any]], preset: Dict[str, Any]
+) -> CVData:
     keywords = general["keywords"]
     if general.get("use_preset_keywords", True):
         keywords = merge_keywords(keywords, preset.get("extra_keywords", []))
@@ -925,167 +2818,392 @@ def build_cv(preset: Dict[str, Any]) -> CVData:
             bullets=exp.get("bullets", []),
             tags=exp.get("tags", []),
         )
-        for exp in st.session_state["experiences"]
-        if exp.get("enabled", True)
+        for exp in included_experiences(general, experiences)
+    ]
+
+    education = [
+        EducationItem(
+            title=edu.get("title", ""),
+            school=edu.get("school", ""),
+            dates=edu.get("dates", ""),
+            details=edu.get("details", ""),
+        )
+        for edu in education
+        if edu.get("enabled", True)
     ]
 
-    education = [
-        EducationItem(
-            title=edu.get("title", ""),
-            school=edu.get("school", ""),
-            dates=edu.get("dates", ""),
-            details=edu.get("details", ""),
-        )
-        for edu in st.session_state["education"]
-        if edu.get("enabled", True)
-    ]
+    return sanitize_cv(CVData(
+        name=general["name"],
+        headline=general["headline"],
+        location=general["location"],
+        phone=general["phone"],
+        email=general["email"],
+        linkedin=general["linkedin"],
+        websites=general["websites"],
+        languages=general["languages"],
+        softskills=general["softskills"],
+        tools=general["tools"],
+        interests=general["interests"],
+        summary=general["summary"],
+        experiences=experiences,
+        education=education,
+        keywords=keywords,
+    ))
+
+
+def _html_lines(text: str) -> str:
+    if not text:
+        return ""
+    return "<br>".join(escape(line) for line in text.splitlines())
+
+
+# Gabarits compilés une fois par mode (indenté ou minifié) ; la feuille de style est analysée une fois par thème.
+HTML_TEMPLATES: Dict[str, str] = {
+    "badge": '<span class="badge">$value</span>',
+    "bullet": "<li>$text</li>",
+    "bullets": '<ul class="clean-list">$items</ul>',
+    "tags": "<div>$badges</div>",
+    "heading": '<div class="h2">$title</div>',
+    "experience": """
+                <article>
+                    <div class=\"h3\">$role_org</div>
+                    <div class=\"small muted\">$dates</div>
+                    $bullets
+                    $tags
+                </article>
+                """,
+    "education_details": '<p class="small muted">$details</p>',
+    "education": """
+                <article>
+                    <div class=\"h3\">$title</div>
+                    <div class=\"small muted\">$subtitle</div>
+                    $details
+                </article>
+                """,
+    "summary": """
+            <section>
+                <div class=\"h2\">Résumé</div>
+                <p class=\"muted\">$summary</p>
+            </section>
+            """,
+    "skills": """
+            <section>
+                <div class=\"h2\">Compétences</div>
+                <p><strong>Langues :</strong><br>$languages</p>
+                <p><strong>Soft skills :</strong><br>$softskills</p>
+                <p><strong>Outils :</strong><br>$tools</p>
+            </section>
+            """,
+    "interests": """
+            <section>
+                <div class=\"h2\">Centres d’intérêt</div>
+                <p>$interests</p>
+            </section>
+            """,
+    "keywords": """
+            <section>
+                <div class=\"h2\">Mots-clés</div>
+                <div>$badges</div>
+            </section>
+            """,
+    "grid_single": "<div>$main</div>",
+    "grid_split": '<div>$main</div><aside class="side-card">$side</aside>',
+    "page": """
+    <div class=\"cv-page\">
+        <header>
+            <div class=\"h1\">$name</div>
+            <div class=\"muted\">$headline</div>
+            <div class=\"small muted\">$contact</div>
+            <div class=\"rule\"></div>
+        </header>
+        <div class=\"$grid_class\">$grid</div>
+        <div class=\"footer\">Astuce : adapte l’accroche et les tags selon la cible. Les déclinaisons sont gérées dans la barre latérale.</div>
+    </div>
+    """,
+    "wrapper": '<div class="preview-wrapper">$page</div>',
+    "document": """<!DOCTYPE html>
+<html lang=\"fr\">
+<head>
+<meta charset=\"utf-8\">
+<title>CV - $name</title>
+$styles
+</head>
+<body>
+<main>$page</main>
+</body>
+</html>
+""",
+}
+HTML_EXPORT_CSS = """<style>
+body {
+  background: #f8fafc;
+  margin: 0;
+  padding: 32px 0;
+  font-family: \"Inter\", -apple-system, BlinkMacSystemFont, \"Segoe UI\", sans-serif;
+}
+main {
+  display: flex;
+  justify-content: center;
+  padding: 0 24px;
+}
+@page { size: A4; margin: 12mm; }
+</style>"""
+DEFAULT_HTML_ACCENT = "#0E7490"
+
+
+@dataclass(frozen=True)
+class CssRule:
+    selector: str
+    body: str
+    media: str = ""  # prélude du bloc @media englobant, vide au premier niveau
+
+
+def _minify_markup(source: str) -> str:
+    # Les retours à la ligne des gabarits ne servent qu'à l'indentation : aucun texte n'y est coupé.
+    return re.sub(r"\s*\n\s*", "", source)
+
+
+def _minify_css(source: str) -> str:
+    return re.sub(r"\s*([{}:;,>])\s*", r"\1", re.sub(r"\s+", " ", source)).strip().rstrip(";")
+
+
+@process_lru_cache(maxsize=2)
+def compile_html_templates(minify: bool = False) -> Dict[str, Template]:
+    return {name: Template(_minify_markup(source) if minify else source) for name, source in HTML_TEMPLATES.items()}
+
+
+@process_lru_cache(maxsize=32)
+def themed_stylesheet(accent: Optional[str] = None) -> str:
+    stylesheet = CSS + "\n" + HTML_EXPORT_CSS
+    if accent and accent.upper() != DEFAULT_HTML_ACCENT:
+        stylesheet = stylesheet.replace(f"--accent: {DEFAULT_HTML_ACCENT};", f"--accent: {accent};")
+    return stylesheet
+
+
+@process_lru_cache(maxsize=32)
+def compile_stylesheet(accent: Optional[str] = None) -> Tuple[CssRule, ...]:
+    source = re.sub(r"</?style>", "", themed_stylesheet(accent))
+    rules: List[CssRule] = []
+    for block in re.finditer(r"(@media[^{]+)\{((?:[^{}]*\{[^{}]*\})*)\s*\}|([^{}@]+)\{([^{}]*)\}|(@page[^{]*)\{([^{}]*)\}", source):
+        if block[1]:
+            media = _minify_css(block[1])
+            rules.extend(CssRule(_minify_css(inner[1]), _minify_css(inner[2]), media) for inner in re.finditer(r"([^{}]+)\{([^{}]*)\}", block[2]))
+        elif block[3]:
+            rules.append(CssRule(_minify_css(block[3]), _minify_css(block[4])))
+        else:
+            rules.append(CssRule(_minify_css(block[5]), _minify_css(block[6])))
+    return tuple(rules)
+
+
+def _selector_used(selector: str, classes: frozenset) -> bool:
+    # Un sélecteur est conservé si l'une de ses alternatives ne cite que des classes présentes dans le document.
+    return any(all(name in classes for name in re.findall(r"\.([\w-]+)", part)) for part in selector.split(","))
+
+
+@process_lru_cache(maxsize=256)
+def used_css(accent: Optional[str], classes: frozenset) -> str:
+    chunks: List[str] = []
+    open_media = ""
+    for rule in compile_stylesheet(accent):
+        if not _selector_used(rule.selector, classes):
+            continue
+        if rule.media != open_media:
+            chunks.append("}" if open_media else "")
+            chunks.append(f"{rule.media}{{" if rule.media else "")
+            open_media = rule.media
+        chunks.append(f"{rule.selector}{{{rule.body}}}")
+    if open_media:
+        chunks.append("}")
+    return "".join(chunks)
+
+
+def _html_classes(markup: str) -> frozenset:
+    return frozenset(name for value in re.findall(r'class="([^"]*)"', markup) for name in value.split())
 
-    return CVData(
-        name=general["name"],
-        headline=general["headline"],
-        location=general["location"],
-        phone=general["phone"],
-        email=general["email"],
-        linkedin=general["linkedin"],
-        websites=general["websites"],
-        languages=general["languages"],
-        softskills=general["softskills"],
-        tools=general["tools"],
-        interests=general["interests"],
-        summary=general["summary"],
-        experiences=experiences,
-        education=education,
-        keywords=keywords,
-    )
 
+def _html_badges(values: List[str], minify: bool = False) -> str:
+    badge = compile_html_templates(minify)["badge"]
+    return "".join(badge.substitute(value=escape(value)) for value in values if value)
 
-def _html_lines(text: str) -> str:
-    if not text:
-        return ""
-    return "<br>".join(escape(line) for line in text.splitlines())
+
+# Les fragments par entrée ne dépendent que de leur contenu : ils sont partagés entre aperçu, exports et galerie.
+@process_lru_cache(maxsize=4096)
+def _experience_article_html(
+    role: str, org: str, dates: str, bullets: Tuple[str, ...], tags: Tuple[str, ...], minify: bool = False
+) -> str:
+    templates = compile_html_templates(minify)
+    role_org = " — ".join([part for part in [role, org] if part])
+    bullet_items = "".join([templates["bullet"].substitute(text=_html_lines(bullet)) for bullet in bullets])
+    tag_badges = _html_badges(list(tags), minify)
+    return templates["experience"].substitute(
+        role_org=escape(role_org),
+        dates=escape(dates),
+        bullets=templates["bullets"].substitute(items=bullet_items) if bullet_items else "",
+        tags=templates["tags"].substitute(badges=tag_badges) if tag_badges else "",
+    )
 
 
-def _html_badges(values: List[str]) -> str:
-    return "".join(f'<span class="badge">{escape(value)}</span>' for value in values if value)
+@process_lru_cache(maxsize=4096)
+def _education_article_html(title: str, school: str, dates: str, details: str, minify: bool = False) -> str:
+    templates = compile_html_templates(minify)
+    subtitle = " — ".join([part for part in [school, dates] if part])
+    return templates["education"].substitute(
+        title=escape(title),
+        subtitle=escape(subtitle),
+        details=templates["education_details"].substitute(details=_html_lines(details)) if details else "",
+    )
 
 
-def build_preview_html(cv: CVData, show_sections: Dict[str, bool], *, include_wrapper: bool = True) -> str:
+def build_preview_html(
+    cv: CVData, show_sections: Dict[str, bool], *, include_wrapper: bool = True, minify: bool = False
+) -> str:
+    templates = compile_html_templates(minify)
     contact_items = [cv.location, cv.phone, cv.email, cv.linkedin] + cv.websites
     contact_line = delist([item for item in contact_items if item])
-    contact_html = escape(contact_line) if contact_line else ""
 
     main_blocks: List[str] = []
     if show_sections.get("Résumé", True) and cv.summary:
-        main_blocks.append(
-            f"""
-            <section>
-                <div class=\"h2\">Résumé</div>
-                <p class=\"muted\">{_html_lines(cv.summary)}</p>
-            </section>
-            """
-        )
+        main_blocks.append(templates["summary"].substitute(summary=_html_lines(cv.summary)))
 
     if show_sections.get("Expériences", True) and cv.experiences:
-        exp_html = ["<div class=\"h2\">Expériences</div>"]
+        exp_html = [templates["heading"].substitute(title="Expériences")]
         for exp in cv.experiences:
-            role_org = " — ".join([part for part in [exp.role, exp.org] if part])
-            bullets = "".join([f"<li>{_html_lines(bullet)}</li>" for bullet in exp.bullets])
-            bullets_html = f"<ul class=\"clean-list\">{bullets}</ul>" if bullets else ""
-            tags = _html_badges(exp.tags)
-            tags_html = f"<div>{tags}</div>" if tags else ""
-            exp_html.append(
-                f"""
-                <article>
-                    <div class=\"h3\">{escape(role_org)}</div>
-                    <div class=\"small muted\">{escape(exp.dates)}</div>
-                    {bullets_html}
-                    {tags_html}
-                </article>
-                """
-            )
+            exp_html.append(_experience_article_html(exp.role, exp.org, exp.dates, tuple(exp.bullets), tuple(exp.tags), minify))
         main_blocks.append("".join(exp_html))
 
     if show_sections.get("Éducation", True) and cv.education:
-        edu_html = ["<div class=\"h2\">Éducation</div>"]
+        edu_html = [templates["heading"].substitute(title="Éducation")]
         for edu in cv.education:
-            details = f"<p class=\"small muted\">{_html_lines(edu.details)}</p>" if edu.details else ""
-            subtitle = " — ".join([part for part in [edu.school, edu.dates] if part])
-            edu_html.append(
-                f"""
-                <article>
-                    <div class=\"h3\">{escape(edu.title)}</div>
-                    <div class=\"small muted\">{escape(subtitle)}</div>
-                    {details}
-                </article>
-                """
-            )
+            edu_html.append(_education_article_html(edu.title, edu.school, edu.dates, edu.details, minify))
         main_blocks.append("".join(edu_html))
 
     side_blocks: List[str] = []
     if show_sections.get("Compétences", True):
         side_blocks.append(
-            f"""
-            <section>
-                <div class=\"h2\">Compétences</div>
-                <p><strong>Langues :</strong><br>{escape(delist(cv.languages))}</p>
-                <p><strong>Soft skills :</strong><br>{escape(delist(cv.softskills))}</p>
-                <p><strong>Outils :</strong><br>{escape(delist(cv.tools))}</p>
-            </section>
-            """
+            templates["skills"].substitute(
+                languages=escape(delist(cv.languages)),
+                softskills=escape(delist(cv.softskills)),
+                tools=escape(delist(cv.tools)),
+            )
         )
     if show_sections.get("Intérêts", False) and cv.interests:
-        side_blocks.append(
-            f"""
-            <section>
-                <div class=\"h2\">Centres d’intérêt</div>
-                <p>{escape(delist(cv.interests))}</p>
-            </section>
-            """
-        )
+        side_blocks.append(templates["interests"].substitute(interests=escape(delist(cv.interests))))
     if show_sections.get("Mots-clés", False) and cv.keywords:
-        side_blocks.append(
-            f"""
-            <section>
-                <div class=\"h2\">Mots-clés</div>
-                <div>{_html_badges(cv.keywords)}</div>
-            </section>
-            """
-        )
+        side_blocks.append(templates["keywords"].substitute(badges=_html_badges(cv.keywords, minify)))
 
     side_html = "".join(side_blocks)
-    grid_class = "grid-preview"
-    if not side_html:
-        grid_class += " single-column"
-        grid_inner = f"<div>{''.join(main_blocks)}</div>"
+    if side_html:
+        grid_class = "grid-preview"
+        grid = templates["grid_split"].substitute(main="".join(main_blocks), side=side_html)
     else:
-        grid_inner = f"<div>{''.join(main_blocks)}</div><aside class=\"side-card\">{side_html}</aside>"
-
-    page_html = f"""
-    <div class=\"cv-page\">
-        <header>
-            <div class=\"h1\">{escape(cv.name)}</div>
-            <div class=\"muted\">{escape(cv.headline)}</div>
-            <div class=\"small muted\">{contact_html}</div>
-            <div class=\"rule\"></div>
-        </header>
-        <div class=\"{grid_class}\">{grid_inner}</div>
-        <div class=\"footer\">Astuce : adapte l’accroche et les tags selon la cible. Les déclinaisons sont gérées dans la barre latérale.</div>
-    </div>
-    """
+        grid_class = "grid-preview single-column"
+        grid = templates["grid_single"].substitute(main="".join(main_blocks))
 
+    page_html = templates["page"].substitute(
+        name=escape(cv.name),
+        headline=escape(cv.headline),
+        contact=escape(contact_line) if contact_line else "",
+        grid_class=grid_class,
+        grid=grid,
+    )
     if include_wrapper:
-        return f"<div class=\"preview-wrapper\">{page_html}</div>"
+        return templates["wrapper"].substitute(page=page_html)
     return page_html
 
 
+@dataclass
+class PresetVariant:
+    name: str
+    cv: CVData
+    show_sections: Dict[str, bool]
+    preview_html: str
+    layout: PageLayout
+
+
+def cached_cv_layout(
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    *,
+    font_family: str = DEFAULT_PDF_FONT_FAMILY,
+    cache: Optional[SharedCache] = None,
+    session_id: Optional[str] = None,
+) -> PageLayout:
+    cache = cache or get_shared_cache()
+    return cache.get_or_create(
+        "layout:" + content_hash(cv, show_sections, font_family),
+        lambda: measure_cv_layout(cv, show_sections, font_family=font_family),
+        session_id=session_id,
+    )
+
+
+def build_preset_gallery(
+    general: Dict[str, Any],
+    experiences: List[Dict[str, Any]],
+    education: List[Dict[str, Any]],
+    presets: Dict[str, Dict[str, Any]],
+    *,
+    font_family: str = DEFAULT_PDF_FONT_FAMILY,
+) -> List[PresetVariant]:
+    # Les objets Streamlit ne sont pas accessibles depuis les threads : cache et session sont résolus ici.
+    cache = get_shared_cache()
+    session_id = current_session_id()
+
+    def build_variant(name: str) -> PresetVariant:
+        preset = presets[name]
+        cv = build_preset_variant(general, experiences, education, preset)
+        sections = default_sections_for_preset(preset)
+        preview_html = cache.get_or_create(
+            "preview:" + content_hash(cv, sections), lambda: build_preview_html(cv, sections, minify=True), session_id=session_id
+        )
+        layout = cached_cv_layout(cv, sections, font_family=font_family, cache=cache, session_id=session_id)
+        return PresetVariant(name=name, cv=cv, show_sections=sections, preview_html=preview_html, layout=layout)
+
+    if not presets:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(presets), os.cpu_count() or 1)) as pool:
+        return list(pool.map(build_variant, presets))
+
+
 def render_preview(cv: CVData, show_sections: Dict[str, bool]) -> None:
     st.markdown('<div class="rule"></div>', unsafe_allow_html=True)
     st.subheader("👀 Aperçu web")
     with st.container():
-        st.markdown(build_preview_html(cv, show_sections), unsafe_allow_html=True)
+        preview_html = get_shared_cache().get_or_create(
+            "preview:" + content_hash(cv, show_sections), lambda: build_preview_html(cv, show_sections, minify=True)
+        )
+        st.markdown(preview_html, unsafe_allow_html=True)
+
+
+def render_preset_gallery(font_family: str) -> None:
+    st.markdown('<div class="rule"></div>', unsafe_allow_html=True)
+    st.subheader("🖼️ Galerie des déclinaisons")
+    if not st.checkbox("Comparer toutes les déclinaisons côte à côte", value=False, key="show_preset_gallery"):
+        return
+    variants = build_preset_gallery(
+        st.session_state["cv_general"], st.session_state["experiences"], st.session_state["education"], PRESETS, font_family=font_family
+    )
+    for row_start in range(0, len(variants), 2):
+        for column, variant in zip(st.columns(2), variants[row_start:row_start + 2]):
+            with column:
+                st.markdown(f"**{escape(variant.name)}**")
+                main_col, side_col = st.columns(2)
+                main_col.metric("Colonne principale", f"{variant.layout.fill_ratio('main'):.0%}")
+                side_col.metric("Colonne latérale", f"{variant.layout.fill_ratio('side'):.0%}")
+                dropped = variant.layout.dropped
+                if dropped:
+                    st.warning(f"{len(dropped)} élément(s) coupé(s) : " + ", ".join(block.label for block in dropped[:5]))
+                else:
+                    st.caption("Tout le contenu tient sur une page.")
+                st.markdown(variant.preview_html, unsafe_allow_html=True)
 
 
-def render_export(cv: CVData, show_sections: Dict[str, bool], signature: Optional[bytes], theme_color: str) -> None:
+def render_export(
+    cv: CVData,
+    show_sections: Dict[str, bool],
+    signature: Optional[bytes],
+    theme_color: str,
+    pdf_options: Optional[Dict[str, Any]] = None,
+) -> None:
     st.markdown('<div class="rule"></div>', unsafe_allow_html=True)
     st.subheader("📄 Export PDF & Signature")
     col1, col2 = st.columns([1, 1])
@@ -1098,10 +3216,35 @@ def render_export(cv: CVData, show_sections: Dict[str, bool], signature: Optiona
         )
     with col2:
         if st.button("Générer le PDF"):
-            pdf_bytes = cv_to_pdf_bytes(cv, show_sections, signature, theme_color)
+            if st.session_state.get("profile_request") == "pdf":
+                # Capture demandée : le cache des PDF terminés est contourné pour mesurer un vrai rendu.
+                st.session_state.pop("profile_request")
+                capture = ProfileCapture("pdf", "cv_to_pdf_bytes")
+                with capture:
+                    pdf_bytes = cv_to_pdf_bytes(cv, show_sections, signature, theme_color, **(pdf_options or {}))
+                store_profile_report(capture.report)
+                if capture.report:
+                    render_profile_report_download(capture.report)
+            else:
+                pdf_bytes = cached_cv_pdf(cv, show_sections, signature, theme_color, **(pdf_options or {}))
             fname = f"CV_{cv.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
             download_button_bytes(pdf_bytes, fname, "⬇️ Télécharger le PDF")
-        html_bytes = cv_to_html(cv, show_sections)
+        # Mesure à la demande : six rendus hors cache, à ne pas payer à chaque export.
+        if st.button("Comparer sorties standard et compacte", help="Rend le CV trois fois dans chaque mode et compare taille et durée."):
+            report = compare_pdf_output_modes(cv, show_sections, signature, theme_color, **(pdf_options or {}))
+            standard, compact = report["standard"], report["compact"]
+            st.caption(
+                f"Sortie compacte : {compact['bytes'] / 1024:.1f} Ko contre {standard['bytes'] / 1024:.1f} Ko "
+                f"({(1 - compact['bytes'] / standard['bytes']) * 100:.1f} % de moins), "
+                f"rendu {compact['seconds'] * 1000:.1f} ms contre {standard['seconds'] * 1000:.1f} ms."
+            )
+        minify_html = st.checkbox(
+            "HTML compact",
+            value=False,
+            key="html_minify",
+            help="Balisage minifié et uniquement les règles CSS utilisées par le CV : fichier plus léger.",
+        )
+        html_bytes = cached_cv_html(cv, show_sections, theme_color=theme_color, minify=minify_html)
         html_name = f"CV_{cv.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M')}.html"
         st.download_button(
             "⬇️ Télécharger en HTML (impression possible)",
@@ -1110,11 +3253,37 @@ def render_export(cv: CVData, show_sections: Dict[str, bool], signature: Optiona
             mime="text/html",
             help="Ouvre le fichier dans ton navigateur puis utilise la fonction Imprimer pour générer un PDF au format A4.",
         )
+        st.download_button(
+            "⬇️ Télécharger le profil (JSON)",
+            data=profile_to_json(st.session_state["cv_general"], st.session_state["experiences"], st.session_state["education"]),
+            file_name=f"profil_{output_slug(cv.name)}.json",
+            mime="application/json",
+            help="À versionner, puis à utiliser avec `python app_cv_modulaire.py watch profil.json`.",
+        )
 
 
 # ====== MAIN APP ======
 def main() -> None:
+    if st.session_state.get("profile_request") != "rerun" and not claim_env_profile_request("rerun"):
+        render_app()
+        return
+    st.session_state.pop("profile_request", None)
+    capture = ProfileCapture("rerun", "main")
+    try:
+        with capture:
+            render_app()
+    finally:
+        # Un rerun déclenché par un widget interrompt la passe : le rapport partiel est conservé quand même.
+        store_profile_report(capture.report)
+    if capture.report:
+        with st.sidebar:
+            st.success("Rerun profilé : rapport prêt.")
+            render_profile_report_download(capture.report)
+
+
+def render_app() -> None:
     init_state()
+    record_history()
     sidebar_state = render_sidebar()
     preset = sidebar_state["preset"]
 
@@ -1126,15 +3295,1006 @@ def main() -> None:
         )
 
     render_general_information(preset)
-    render_experience_manager()
+    # La recherche s'affiche au-dessus des éditeurs mais s'exécute après eux, sur les saisies de cette passe.
+    search_slot = st.container()
+    budget_slots = render_experience_manager()
     render_education_manager()
+    render_profile_search(search_slot)
 
     cv = build_cv(preset)
+    font_family = sidebar_state["pdf_options"].get("font_family", DEFAULT_PDF_FONT_FAMILY)
+    render_page_budget(
+        cached_cv_layout(cv, sidebar_state["show_sections"], font_family=font_family),
+        budget_slots,
+        [exp["uid"] for exp in included_experiences(st.session_state["cv_general"], st.session_state["experiences"])],
+    )
     render_preview(cv, sidebar_state["show_sections"])
-    render_export(cv, sidebar_state["show_sections"], sidebar_state["signature"], sidebar_state["theme_color"])
+    render_preset_gallery(font_family)
+    render_export(
+        cv,
+        sidebar_state["show_sections"],
+        sidebar_state["signature"],
+        sidebar_state["theme_color"],
+        sidebar_state["pdf_options"],
+    )
 
     st.caption("© Toi. Ce script est 100% local. Tu peux enrichir les presets/sections selon les candidatures.")
+    record_history()
+    render_history_controls(sidebar_state["history_slot"])
+    sync_session_token()
+
+
+# ====== FICHIERS DE PROFIL & MODE WATCH ======
+def profile_to_json(general: Dict[str, Any], experiences: List[Dict[str, Any]], education: List[Dict[str, Any]]) -> bytes:
+    payload = {"cv_general": general, "experiences": experiences, "education": education}
+    return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def profile_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    raw_general = data.get("cv_general", {})
+    general = default_general_state()
+    general.update(raw_general)
+    if "headline_base" not in raw_general and "headline" in raw_general:
+        general["headline_base"] = raw_general["headline"]
+    experiences = [
+        {"role": "", "org": "", "dates": "", "bullets": [], "tags": [], "enabled": True, **exp, "uid": exp.get("uid") or str(uuid4())}
+        for exp in data.get("experiences", [])
+    ]
+    education = [
+        {"title": "", "school": "", "dates": "", "details": "", "enabled": True, **edu, "uid": edu.get("uid") or str(uuid4())}
+        for edu in data.get("education", [])
+    ]
+    # Le fichier a pu être édité à la main : les périodes sont toujours réanalysées au chargement.
+    for entry in experiences + education:
+        entry.update(period_fields(entry["dates"]))
+    return {"cv_general": general, "experiences": experiences, "education": education}
+
+
+def load_profile_file(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as handle:
+        return profile_from_dict(json.load(handle))
+
+
+def load_presets_file(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not path:
+        return PRESETS
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def output_slug(name: str) -> str:
+    return re.sub(r"[^\w-]+", "_", normalize_text(name)).strip("_") or "cv"
+
+
+def _write_atomically(path: str, write: Callable[[BinaryIO], Any]) -> None:
+    # Le fichier final n'apparaît qu'une fois complet : une visionneuse ouverte ne lit jamais un PDF tronqué.
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as handle:
+        write(handle)
+    os.replace(temp_path, path)
+
+
+def render_profile_outputs(
+    profile: Dict[str, Any],
+    presets: Dict[str, Dict[str, Any]],
+    out_dir: str,
+    *,
+    formats: Tuple[str, ...] = ("pdf", "html"),
+    theme_color: str = "#0F766E",
+    rendered_hashes: Optional[Dict[str, str]] = None,
+    minify_html: bool = False,
+    **pdf_options: Any,
+) -> List[str]:
+    # `rendered_hashes` mémorise, par déclinaison et format, l'empreinte du dernier contenu écrit :
+    # seules les sorties dont le contenu a changé sont régénérées.
+    rendered_hashes = {} if rendered_hashes is None else rendered_hashes
+    os.makedirs(out_dir, exist_ok=True)
+    written: List[str] = []
+    for name, preset in presets.items():
+        # build_preset_variant renvoie un CV déjà borné par sanitize_cv.
+        cv = build_preset_variant(profile["cv_general"], profile["experiences"], profile["education"], preset)
+        sections = default_sections_for_preset(preset)
+        base_path = os.path.join(out_dir, output_slug(name))
+        for output_format in formats:
+            digest = content_hash(output_format, cv, sections, theme_color, minify_html, pdf_options)
+            slot = f"{name}:{output_format}"
+            if rendered_hashes.get(slot) == digest:
+                continue
+            path = f"{base_path}.{output_format}"
+            if output_format == "pdf":
+                _write_atomically(path, lambda handle: write_cv_pdf(handle, cv, sections, None, theme_color, **pdf_options))
+            else:
+                html_bytes = cached_cv_html(cv, sections, theme_color=theme_color, minify=minify_html)
+                _write_atomically(path, lambda handle: handle.write(html_bytes))
+            rendered_hashes[slot] = digest
+            written.append(path)
+    return written
+
+
+def _file_signature(paths: List[str]) -> Tuple[Tuple[str, int, int], ...]:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append((path, -1, -1))
+        else:
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def watch_profile(
+    profile_path: str,
+    presets_path: Optional[str],
+    out_dir: str,
+    *,
+    preset_names: Optional[List[str]] = None,
+    formats: Tuple[str, ...] = ("pdf", "html"),
+    theme_color: str = "#0F766E",
+    minify_html: bool = False,
+    interval: float = 0.2,
+    debounce: float = 0.3,
+    once: bool = False,
+) -> None:
+    watched = [profile_path] + ([presets_path] if presets_path else [])
+    rendered_hashes: Dict[str, str] = {}
+    last_signature = None
+    while True:
+        signature = _file_signature(watched)
+        if signature != last_signature:
+            # Anti-rebond : on attend que les fichiers restent stables `debounce` secondes avant de rendre.
+            while True:
+                time.sleep(debounce if last_signature is not None else 0)
+                settled = _file_signature(watched)
+                if settled == signature:
+                    break
+                signature = settled
+            last_signature = signature
+            start = time.perf_counter()
+            try:
+                profile = load_profile_file(profile_path)
+                presets = load_presets_file(presets_path)
+                if preset_names:
+                    presets = {name: preset for name, preset in presets.items() if name in preset_names}
+                written = render_profile_outputs(
+                    profile,
+                    presets,
+                    out_dir,
+                    formats=formats,
+                    theme_color=theme_color,
+                    rendered_hashes=rendered_hashes,
+                    minify_html=minify_html,
+                    incremental=True,
+                )
+            except Exception as exc:  # fichier à moitié édité : on signale et on continue de surveiller
+                print(f"[watch] Rendu impossible ({type(exc).__name__}) : {exc}", flush=True)
+            else:
+                elapsed = (time.perf_counter() - start) * 1000
+                if written:
+                    print(f"[watch] {len(written)} fichier(s) régénéré(s) en {elapsed:.0f} ms : " + ", ".join(written), flush=True)
+                else:
+                    print(f"[watch] Aucun changement de contenu ({elapsed:.0f} ms).", flush=True)
+            if once:
+                return
+        time.sleep(interval)
+
+
+# ====== INSTANTANÉ BINAIRE DE BIBLIOTHÈQUE (mmap) ======
+# Disposition : en-tête fixe | enregistrements zlib (JSON compact, un par profil, plus un pour les presets) |
+# index JSON (nom → offset, longueur). Les profils y sont déjà normalisés (périodes analysées) : un worker
+# n'a qu'à décompresser l'enregistrement demandé, et tous les workers partagent les pages du même fichier.
+SNAPSHOT_MAGIC = b"CVLIB\x00"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<6sHQQ")
+SNAPSHOT_DECODED_PROFILES = 8
+
+
+def _snapshot_record(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def write_profile_snapshot(path: str, profiles: Dict[str, Dict[str, Any]], presets: Dict[str, Dict[str, Any]]) -> int:
+    def write(handle: BinaryIO) -> None:
+        handle.write(b"\x00" * SNAPSHOT_HEADER.size)
+        offset = SNAPSHOT_HEADER.size
+        index: Dict[str, Any] = {"profiles": {}}
+        for name, profile in profiles.items():
+            record = _snapshot_record(profile)
+            handle.write(record)
+            index["profiles"][name] = [offset, len(record)]
+            offset += len(record)
+        record = _snapshot_record(presets)
+        handle.write(record)
+        index["presets"] = [offset, len(record)]
+        offset += len(record)
+        index_bytes = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        handle.write(index_bytes)
+        handle.seek(0)
+        handle.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, offset, len(index_bytes)))
+
+    _write_atomically(path, write)
+    return os.path.getsize(path)
+
+
+class ProfileSnapshot:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_offset, index_length = SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} n'est pas un instantané de bibliothèque (version {SNAPSHOT_VERSION}).")
+        index = json.loads(self._map[index_offset : index_offset + index_length])
+        self._offsets: Dict[str, Tuple[int, int]] = {name: tuple(span) for name, span in index["profiles"].items()}
+        self._presets_span: Tuple[int, int] = tuple(index["presets"])
+        self._decoded: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._presets: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def __enter__(self) -> "ProfileSnapshot":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._decoded.clear()
+        self._map.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._offsets
+
+    def names(self) -> List[str]:
+        return list(self._offsets)
+
+    def _decode(self, span: Tuple[int, int]) -> Any:
+        offset, length = span
+        return json.loads(zlib.decompress(self._map[offset : offset + length]))
+
+    def record_hash(self, name: str) -> str:
+        offset, length = self._offsets[name]
+        return hashlib.blake2b(self._map[offset : offset + length], digest_size=16).hexdigest()
+
+    def profile(self, name: str) -> Dict[str, Any]:
+        # Décodage paresseux. Seuls les SNAPSHOT_DECODED_PROFILES derniers profils restent décodés : un worker
+        # ne garde pas sa propre copie de toute la bibliothèque. L'appelant ne doit pas muter le résultat.
+        if name in self._decoded:
+            self._decoded.move_to_end(name)
+            return self._decoded[name]
+        profile = self._decoded[name] = self._decode(self._offsets[name])
+        if len(self._decoded) > SNAPSHOT_DECODED_PROFILES:
+            self._decoded.popitem(last=False)
+        return profile
+
+    @property
+    def presets(self) -> Dict[str, Dict[str, Any]]:
+        if self._presets is None:
+            self._presets = self._decode(self._presets_span)
+        return self._presets
+
+
+def is_profile_snapshot(path: str) -> bool:
+    with open(path, "rb") as handle:
+        return handle.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+def snapshot_profile_files(paths: List[str], presets: Dict[str, Dict[str, Any]], out_path: str) -> int:
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in profiles:
+            raise ValueError(f"Deux profils portent le nom « {name} » : renommer l’un des fichiers.")
+        profiles[name] = load_profile_file(path)
+    return write_profile_snapshot(out_path, profiles, presets)
+
+
+# ====== FILE DE RENDUS PAR LOTS (SQLite) ======
+# Chaque rendu profil × déclinaison × format est une ligne de la table `jobs`. Les workers réclament les tâches
+# en transaction IMMEDIATE ; une tâche terminée n'est jamais refaite tant que son fichier de sortie existe.
+# Chaque `batch-run` s'inscrit dans la table `runs` : au démarrage suivant, les tâches « running » d'un lot
+# terminé ou dont le processus a disparu (même machine) repassent en attente ; pour un lot d'une autre
+# machine, seul le bail BATCH_LEASE_SECONDS permet de conclure.
+BATCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    job_key TEXT NOT NULL UNIQUE,
+    profile_path TEXT NOT NULL,
+    profile_name TEXT NOT NULL DEFAULT '',
+    profile_hash TEXT NOT NULL,
+    preset_name TEXT NOT NULL,
+    preset TEXT NOT NULL,
+    show_sections TEXT NOT NULL,
+    theme_color TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    output_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    run_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+# Colonnes ajoutées après la création des premières files : ajoutées en place à l'ouverture.
+BATCH_ADDED_COLUMNS = {"profile_name": "TEXT NOT NULL DEFAULT ''", "run_id": "TEXT"}
+BATCH_STATUSES = ("pending", "running", "done", "failed")
+BATCH_MAX_ATTEMPTS = 3
+BATCH_LEASE_SECONDS = 600.0
+BATCH_RATE_WINDOW = 60.0
+
+
+class RenderQueue:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with self._connect() as db:
+            existing = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, definition in BATCH_ADDED_COLUMNS.items():
+                if existing and column not in existing:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            db.executescript(BATCH_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator["sqlite3.Connection"]:
+        # Une connexion par appel : la file est partagée entre processus, et WAL laisse lire pendant les écritures.
+        # Le gestionnaire de contexte de sqlite3 ne fait que valider ou annuler : la fermeture (et celle des
+        # fichiers WAL) est explicite.
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        try:
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def enqueue(
+        self,
+        profile_path: str,
+        presets: Dict[str, Dict[str, Any]],
+        out_dir: str,
+        *,
+        formats: Tuple[str, ...] = ("pdf", "html"),
+        theme_color: str = "#0F766E",
+    ) -> int:
+        with open(profile_path, "rb") as handle:
+            profile_hash = hashlib.blake2b(handle.read(), digest_size=16).hexdigest()
+        profile_label = os.path.splitext(os.path.basename(profile_path))[0]
+        return self._insert(self._job_rows(profile_path, "", profile_label, profile_hash, presets, out_dir, formats, theme_color))
+
+    def enqueue_snapshot(
+        self,
+        snapshot_path: str,
+        out_dir: str,
+        *,
+        names: Optional[List[str]] = None,
+        presets: Optional[Dict[str, Dict[str, Any]]] = None,
+        formats: Tuple[str, ...] = ("pdf", "html"),
+        theme_color: str = "#0F766E",
+    ) -> int:
+        # Les presets embarqués dans l'instantané servent par défaut ; le hachage porte sur l'enregistrement compressé.
+        rows = []
+        with ProfileSnapshot(snapshot_path) as snapshot:
+            presets = snapshot.presets if presets is None else presets
+            for name in names or snapshot.names():
+                rows += self._job_rows(snapshot_path, name, name, snapshot.record_hash(name), presets, out_dir, formats, theme_color)
+        return self._insert(rows)
+
+    @staticmethod
+    def _job_rows(
+        profile_path: str,
+        profile_name: str,
+        profile_label: str,
+        profile_hash: str,
+        presets: Dict[str, Dict[str, Any]],
+        out_dir: str,
+        formats: Tuple[str, ...],
+        theme_color: str,
+    ) -> List[Tuple[Any, ...]]:
+        profile_dir = os.path.join(out_dir, output_slug(profile_label))
+        rows = []
+        for name, preset in presets.items():
+            sections = default_sections_for_preset(preset)
+            for output_format in formats:
+                rows.append(
+                    (
+                        content_hash(profile_hash, name, preset, sections, theme_color, output_format, profile_dir),
+                        os.path.abspath(profile_path),
+                        profile_name,
+                        profile_hash,
+                        name,
+                        json.dumps(preset, ensure_ascii=False),
+                        json.dumps(sections, ensure_ascii=False),
+                        theme_color,
+                        output_format,
+                        os.path.abspath(os.path.join(profile_dir, f"{output_slug(name)}.{output_format}")),
+                        time.time(),
+                    )
+                )
+        return rows
+
+    def _insert(self, rows: List[Tuple[Any, ...]]) -> int:
+        with self._connect() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (job_key, profile_path, profile_name, profile_hash, preset_name, preset,"
+                " show_sections, theme_color, output_format, output_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return db.total_changes - before
+
+    def start_run(self) -> str:
+        run_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO runs (run_id, host, pid, started_at) VALUES (?, ?, ?, ?)",
+                (run_id, socket.gethostname(), os.getpid(), time.time()),
+            )
+        return run_id
+
+    def finish_run(self, run_id: str) -> int:
+        # Un worker mort en cours de rendu (pool cassé) laisse sa tâche « running » : elle est rendue à la file.
+        with self._connect() as db:
+            db.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+            return db.execute(
+                "UPDATE jobs SET status = 'pending', worker = NULL, run_id = NULL WHERE status = 'running' AND run_id = ?", (run_id,)
+            ).rowcount
+
+    def _dead_runs(self, db: "sqlite3.Connection") -> List[str]:
+        host = socket.gethostname()
+        dead = []
+        for row in db.execute(
+            "SELECT DISTINCT runs.run_id, runs.host, runs.pid, runs.finished_at FROM jobs JOIN runs ON runs.run_id = jobs.run_id"
+            " WHERE jobs.status = 'running'"
+        ):
+            if row["finished_at"] is not None or (row["host"] == host and not _process_alive(row["pid"])):
+                dead.append(row["run_id"])
+        return dead
+
+    def recover(self, lease: float = BATCH_LEASE_SECONDS) -> int:
+        # Reprise après incident : tâches des lots arrêtés, bails expirés et sorties « done » disparues du disque
+        # repassent en attente.
+        with self._connect() as db:
+            dead_runs = self._dead_runs(db)
+            recovered = sum(
+                db.execute(
+                    "UPDATE jobs SET status = 'pending', worker = NULL, run_id = NULL WHERE status = 'running' AND run_id = ?", (run_id,)
+                ).rowcount
+                for run_id in dead_runs
+            )
+            recovered += db.execute(
+                "UPDATE jobs SET status = 'pending', worker = NULL, run_id = NULL WHERE status = 'running' AND claimed_at < ?",
+                (time.time() - lease,),
+            ).rowcount
+            missing = [row["id"] for row in db.execute("SELECT id, output_path FROM jobs WHERE status = 'done'") if not os.path.exists(row["output_path"])]
+            db.executemany("UPDATE jobs SET status = 'pending', output_hash = NULL WHERE id = ?", [(job_id,) for job_id in missing])
+        return recovered + len(missing)
+
+    def claim(self, run_id: str, worker: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT * FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, run_id = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, run_id, time.time(), row["id"]),
+            )
+            db.execute("COMMIT")
+        return dict(row)
+
+    def complete(self, job_id: int, output_hash: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', output_hash = ?, error = NULL, finished_at = ? WHERE id = ?",
+                (output_hash, time.time(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " error = ?, finished_at = ? WHERE id = ?",
+                (BATCH_MAX_ATTEMPTS, error, time.time(), job_id),
+            )
+
+    def progress(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._connect() as db:
+            counts = {status: 0 for status in BATCH_STATUSES}
+            counts.update({row["status"]: row["total"] for row in db.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status")})
+            window = db.execute(
+                "SELECT COUNT(*) AS recent FROM jobs WHERE status = 'done' AND finished_at >= ?", (now - BATCH_RATE_WINDOW,)
+            ).fetchone()["recent"]
+            span = db.execute(
+                "SELECT MIN(claimed_at) AS first, MAX(finished_at) AS last FROM jobs WHERE status = 'done'"
+            ).fetchone()
+            failures = [dict(row) for row in db.execute("SELECT preset_name, output_path, error FROM jobs WHERE status = 'failed' LIMIT 20")]
+        total = sum(counts.values())
+        remaining = counts["pending"] + counts["running"]
+        elapsed = (span["last"] - span["first"]) if span["first"] is not None else 0.0
+        # Au démarrage d'un lot, la fenêtre glissante est ramenée à la durée réellement écoulée.
+        recent_rate = window / min(BATCH_RATE_WINDOW, max(now - span["first"], 1e-3)) if span["first"] is not None else 0.0
+        return {
+            "total": total,
+            "counts": counts,
+            "completed_ratio": counts["done"] / total if total else 0.0,
+            "overall_rate": counts["done"] / elapsed if elapsed > 0 else 0.0,
+            "recent_rate": recent_rate,
+            "eta_seconds": remaining / recent_rate if remaining and recent_rate else None,
+            "failures": failures,
+        }
+
+
+def _render_batch_job(job: Dict[str, Any], sources: Dict[Tuple[str, int], Any]) -> str:
+    # `sources` garde, par fichier et version, le profil JSON chargé ou l'instantané ouvert en mmap.
+    source_key = (job["profile_path"], os.stat(job["profile_path"]).st_mtime_ns)
+    if source_key not in sources:
+        sources[source_key] = ProfileSnapshot(job["profile_path"]) if job["profile_name"] else load_profile_file(job["profile_path"])
+    source = sources[source_key]
+    profile = source.profile(job["profile_name"]) if job["profile_name"] else source
+    cv = build_preset_variant(profile["cv_general"], profile["experiences"], profile["education"], json.loads(job["preset"]))
+    sections = json.loads(job["show_sections"])
+    if job["output_format"] == "pdf":
+        data = cv_to_pdf_bytes(cv, sections, None, job["theme_color"], incremental=True)
+    else:
+        data = cv_to_html(cv, sections, theme_color=job["theme_color"])
+    os.makedirs(os.path.dirname(job["output_path"]), exist_ok=True)
+    _write_atomically(job["output_path"], lambda handle: handle.write(data))
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _process_alive(pid: int) -> bool:
+    # Sous Windows, os.kill(pid, 0) termine le processus : on s'en remet alors au bail.
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_batch_worker(db_path: str, run_id: str, worker: str, max_jobs: Optional[int] = None) -> int:
+    queue = RenderQueue(db_path)
+    sources: Dict[Tuple[str, int], Any] = {}
+    rendered = 0
+    try:
+        while max_jobs is None or rendered < max_jobs:
+            job = queue.claim(run_id, worker)
+            if job is None:
+                break
+            try:
+                output_hash = _render_batch_job(job, sources)
+            except Exception as exc:  # la tâche est retentée (BATCH_MAX_ATTEMPTS) sans arrêter le worker
+                queue.fail(job["id"], f"{type(exc).__name__}: {exc}")
+            else:
+                queue.complete(job["id"], output_hash)
+                rendered += 1
+    finally:
+        for source in sources.values():
+            if isinstance(source, ProfileSnapshot):
+                source.close()
+    return rendered
+
+
+def run_batch(db_path: str, *, workers: int = 1, lease: float = BATCH_LEASE_SECONDS) -> int:
+    from concurrent.futures import ProcessPoolExecutor
+
+    queue = RenderQueue(db_path)
+    queue.recover(lease)
+    run_id = queue.start_run()
+    try:
+        if workers <= 1:
+            return run_batch_worker(db_path, run_id, f"{run_id}/0")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return sum(
+                pool.map(run_batch_worker, [db_path] * workers, [run_id] * workers, [f"{run_id}/{index}" for index in range(workers)])
+            )
+    finally:
+        queue.finish_run(run_id)
+
+
+# ====== TEST DE CHARGE (sessions simulées) ======
+# AppTest remplace le Runtime global de Streamlit à chaque rerun : deux AppTest ne peuvent pas tourner en
+# parallèle dans un même processus. Chaque worker est donc un processus qui entrelace plusieurs sessions,
+# comme un serveur Streamlit sert plusieurs onglets (cache partagé et mémos communs à ses sessions).
+LOAD_TEST_ACTIONS = ("edit_name", "edit_bullets", "reorder", "switch_preset", "export_pdf", "export_html")
+LOAD_TEST_PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class LoadTestSession:
+    user: int
+    worker: int
+    timings: List[Tuple[str, float]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    session_bytes: int = 0
+
+
+def _widget(widgets: Any, predicate: Callable[[Any], bool]) -> Optional[Any]:
+    return next((widget for widget in widgets if predicate(widget)), None)
+
+
+def _script_action(at: Any, action: str, rng: random.Random) -> bool:
+    if action == "edit_name":
+        widget = _widget(at.text_input, lambda w: w.label == "Nom complet")
+        if widget is not None:
+            widget.set_value(f"Utilisateur {rng.randrange(10_000)}")
+    elif action == "edit_bullets":
+        candidates = [w for w in at.text_area if str(w.key or "").endswith("_bullets")]
+        widget = rng.choice(candidates) if candidates else None
+        if widget is not None:
+            widget.set_value(f"{widget.value}\nRésultat mesuré n°{rng.randrange(100)}")
+    elif action == "reorder":
+        candidates = [w for w in at.button if str(w.key or "").endswith(("_up", "_down")) and not w.disabled]
+        widget = rng.choice(candidates) if candidates else None
+        if widget is not None:
+            widget.click()
+    elif action == "switch_preset":
+        widget = _widget(at.sidebar.selectbox, lambda w: w.label == "Déclinaison (destinataire / usage)")
+        if widget is not None:
+            widget.select_index(rng.randrange(len(widget.options)))
+    elif action == "export_pdf":
+        widget = _widget(at.button, lambda w: w.label == "Générer le PDF")
+        if widget is not None:
+            widget.click()
+    else:
+        # Basculer « HTML compact » refait passer l'export HTML par cached_cv_html avec l'autre variante.
+        widget = _widget(at.checkbox, lambda w: w.key == "html_minify")
+        if widget is not None:
+            widget.set_value(not widget.value)
+    return widget is not None
+
+
+def _session_state_bytes(at: Any) -> int:
+    total = 0
+    for key, value in at.session_state.items():
+        memory_bytes = getattr(value, "memory_bytes", None)
+        total += approx_size(key) + (memory_bytes() if callable(memory_bytes) else approx_size(value))
+    return total
+
+
+def _run_load_worker(
+    worker: int, users: Tuple[int, ...], script_path: str, actions: int, timeout: float, seed: int
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Optional[int]]:
+    from streamlit.testing.v1 import AppTest
+
+    sessions = [LoadTestSession(user=user, worker=worker) for user in users]
+    apps = [AppTest.from_file(script_path, default_timeout=timeout) for _ in users]
+    rngs = [random.Random(seed + user) for user in users]
+    for step in range(actions + 1):
+        for session, at, rng in zip(sessions, apps, rngs):
+            if step and session.errors and not session.timings:
+                continue
+            action = "first_load" if step == 0 else rng.choice(LOAD_TEST_ACTIONS)
+            try:
+                if step and not _script_action(at, action, rng):
+                    session.errors.append(f"{action} : widget introuvable")
+                started = time.perf_counter()
+                at.run()
+                session.timings.append((action, time.perf_counter() - started))
+            except Exception as exc:  # une session en échec ne doit pas interrompre le test de charge
+                session.errors.append(f"{action} : {exc}")
+                continue
+            session.errors.extend(f"{action} : {error.message}" for error in at.exception)
+    for session, at in zip(sessions, apps):
+        session.session_bytes = _session_state_bytes(at)
+    # AppTest réexécute ce fichier en tant que __main__ : on renvoie des dicts, les classes ne seraient plus picklables.
+    return [asdict(session) for session in sessions], get_shared_cache().stats(), _process_peak_rss()
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percentile / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _process_peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_load_test(
+    users: int, actions: int, *, workers: Optional[int] = None, script_path: str = __file__, timeout: float = 60.0, seed: int = 0
+) -> Dict[str, Any]:
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = max(1, min(users, workers or os.cpu_count() or 1))
+    assignments = [tuple(range(worker, users, workers)) for worker in range(workers)]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_run_load_worker, worker, assigned, script_path, actions, timeout, seed)
+            for worker, assigned in enumerate(assignments)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    sessions = sorted(
+        (LoadTestSession(**session) for worker_sessions, _, _ in results for session in worker_sessions), key=lambda s: s.user
+    )
+    by_action: Dict[str, List[float]] = {}
+    for session in sessions:
+        for action, duration in session.timings:
+            by_action.setdefault(action, []).append(duration)
+    by_action["total"] = list(chain.from_iterable(by_action.values()))
+    latency = {}
+    for action, durations in by_action.items():
+        durations.sort()
+        latency[action] = {"count": len(durations), **{f"p{p}": _percentile(durations, p) for p in LOAD_TEST_PERCENTILES}}
+    session_bytes = [session.session_bytes for session in sessions]
+    return {
+        "users": users,
+        "workers": workers,
+        "actions_per_user": actions,
+        "elapsed": elapsed,
+        "reruns": latency["total"]["count"],
+        "throughput": latency["total"]["count"] / elapsed if elapsed else 0.0,
+        "latency": latency,
+        "session_bytes": {"mean": sum(session_bytes) / len(session_bytes), "max": max(session_bytes)} if session_bytes else {},
+        "shared_cache": [stats for _, stats, _ in results],
+        "worker_peak_rss": [rss for _, _, rss in results],
+        "errors": [f"utilisateur {session.user} – {error}" for session in sessions for error in session.errors],
+    }
+
+
+def check_undo_after_delete(script_path: str = __file__, timeout: float = 60.0) -> List[str]:
+    # Scénario de non-régression : une suppression faite comme toute première action doit être annulable aussitôt.
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(script_path, default_timeout=timeout)
+    at.run()
+    delete = _widget(at.button, lambda w: str(w.key or "").endswith("_delete"))
+    if delete is None:
+        return ["aucune expérience à supprimer dans le profil par défaut"]
+    deleted_uid = str(delete.key)[: -len("_delete")]
+    delete.click().run()
+    problems = [f"suppression : {error.message}" for error in at.exception]
+    if any(exp["uid"] == deleted_uid for exp in at.session_state["experiences"]):
+        problems.append("l’expérience n’a pas été supprimée")
+    undo = _widget(at.sidebar.button, lambda w: w.label == "↩️ Annuler")
+    if undo is None or undo.disabled:
+        return problems + ["« Annuler » reste désactivé après la suppression"]
+    undo.click().run()
+    problems.extend(f"annulation : {error.message}" for error in at.exception)
+    if not any(exp["uid"] == deleted_uid for exp in at.session_state["experiences"]):
+        problems.append("« Annuler » n’a pas restauré l’expérience supprimée")
+    return problems
+
+
+# ====== CLI ======
+def _cli_stress_wrap(args: argparse.Namespace) -> int:
+    report = stress_line_breaker(tuple(args.sizes))
+    worst_ratio = 0.0
+    for label, timings in report.items():
+        per_char = [elapsed / size for size, elapsed in timings]
+        ratio = per_char[-1] / max(per_char[0], 1e-12)
+        worst_ratio = max(worst_ratio, ratio)
+        details = ", ".join(f"{size} car. : {elapsed * 1000:.1f} ms" for size, elapsed in timings)
+        print(f"{label:<20} {details} (coût par caractère ×{ratio:.2f})")
+    if worst_ratio > args.max_ratio:
+        print(f"Croissance super-linéaire détectée (×{worst_ratio:.2f} > ×{args.max_ratio}).")
+        return 1
+    print("Coût linéaire confirmé.")
+    return 0
+
+
+def _cli_watch(args: argparse.Namespace) -> int:
+    print(f"[watch] Surveillance de {args.profile}" + (f" et {args.presets}" if args.presets else "") + f" → {args.out}", flush=True)
+    try:
+        watch_profile(
+            args.profile,
+            args.presets,
+            args.out,
+            preset_names=args.preset,
+            formats=tuple(args.formats),
+            theme_color=args.theme,
+            minify_html=args.minify_html,
+            interval=args.interval,
+            debounce=args.debounce,
+            once=args.once,
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _cli_loadtest(args: argparse.Namespace) -> int:
+    print(f"[loadtest] {args.users} utilisateur(s) simulé(s) × {args.actions} action(s)…", flush=True)
+    report = run_load_test(args.users, args.actions, workers=args.workers, timeout=args.timeout, seed=args.seed)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"{report['reruns']} reruns en {report['elapsed']:.1f} s → {report['throughput']:.2f} reruns/s")
+        for action, stats in report["latency"].items():
+            percentiles = "  ".join(f"{name} {stats[name] * 1000:7.1f} ms" for name in (f"p{p}" for p in LOAD_TEST_PERCENTILES))
+            print(f"  {action:<14} n={stats['count']:<5} {percentiles}")
+        if report["session_bytes"]:
+            print(
+                f"Mémoire par session : moyenne {report['session_bytes']['mean'] / 1024:.0f} Ko,"
+                f" max {report['session_bytes']['max'] / 1024:.0f} Ko"
+            )
+        for worker, (cache, rss) in enumerate(zip(report["shared_cache"], report["worker_peak_rss"])):
+            rss_text = f", RSS max {rss / 1024 / 1024:.0f} Mo" if rss else ""
+            print(
+                f"Worker {worker} : cache partagé {cache['total_bytes'] / 1024 / 1024:.1f} Mo,"
+                f" {cache['hits']} hit(s) / {cache['misses']} miss(es){rss_text}"
+            )
+        for error in report["errors"][:20]:
+            print(f"  ! {error}")
+    return 1 if report["errors"] else 0
+
+
+def _cli_check_undo(args: argparse.Namespace) -> int:
+    problems = check_undo_after_delete(timeout=args.timeout)
+    for problem in problems:
+        print(f"  ! {problem}")
+    print("Historique : échec." if problems else "Historique : suppression annulée aussitôt.")
+    return 1 if problems else 0
+
+
+def _cli_snapshot(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    size = snapshot_profile_files(args.profiles, load_presets_file(args.presets), args.out)
+    print(f"[snapshot] {len(args.profiles)} profil(s) → {args.out} ({size / 1024:.0f} Ko) en {time.perf_counter() - started:.2f} s.")
+    return 0
+
+
+def _select_presets(presets: Dict[str, Dict[str, Any]], names: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+    return {name: presets[name] for name in names} if names else presets
+
+
+def _cli_batch_add(args: argparse.Namespace) -> int:
+    queue = RenderQueue(args.db)
+    options = {"formats": tuple(args.formats), "theme_color": args.theme}
+    added = 0
+    for profile in args.profiles:
+        if is_profile_snapshot(profile):
+            with ProfileSnapshot(profile) as snapshot:
+                presets = _select_presets(load_presets_file(args.presets) if args.presets else snapshot.presets, args.preset)
+            added += queue.enqueue_snapshot(profile, args.out, presets=presets, **options)
+        else:
+            added += queue.enqueue(profile, _select_presets(load_presets_file(args.presets), args.preset), args.out, **options)
+    print(f"[batch] {added} tâche(s) ajoutée(s) ; {queue.progress()['total']} au total dans {args.db}.")
+    return 0
+
+
+def _print_batch_progress(progress: Dict[str, Any]) -> None:
+    counts = progress["counts"]
+    eta = f", fin estimée dans {progress['eta_seconds']:.0f} s" if progress["eta_seconds"] is not None else ""
+    print(
+        f"[batch] {counts['done']}/{progress['total']} terminées ({progress['completed_ratio']:.0%}),"
+        f" {counts['running']} en cours, {counts['pending']} en attente, {counts['failed']} en échec"
+        f" – {progress['recent_rate']:.2f} rendus/s récemment,"
+        f" {progress['overall_rate']:.2f} rendus/s au total{eta}",
+        flush=True,
+    )
+
+
+def _cli_batch_run(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    rendered = run_batch(args.db, workers=args.workers, lease=args.lease)
+    print(f"[batch] {rendered} rendu(s) en {time.perf_counter() - started:.1f} s.")
+    progress = RenderQueue(args.db).progress()
+    _print_batch_progress(progress)
+    for failure in progress["failures"]:
+        print(f"  ! {failure['preset_name']} → {failure['output_path']} : {failure['error']}")
+    unfinished = progress["counts"]["pending"] + progress["counts"]["running"]
+    if unfinished:
+        print(f"[batch] {unfinished} tâche(s) non terminée(s) : lot concurrent encore actif, ou bail non expiré (--lease).")
+    return 1 if progress["counts"]["failed"] or unfinished else 0
+
+
+def _cli_batch_status(args: argparse.Namespace) -> int:
+    queue = RenderQueue(args.db)
+    try:
+        while True:
+            progress = queue.progress()
+            if args.json:
+                print(json.dumps(progress, ensure_ascii=False, indent=2))
+            else:
+                _print_batch_progress(progress)
+            if not args.follow or not progress["counts"]["pending"] + progress["counts"]["running"]:
+                return 0
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        return 0
+
+
+def build_cli_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="app_cv_modulaire.py", description="Outils en ligne de commande du générateur de CV.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stress = commands.add_parser("stress-wrap", help="Vérifie que la césure reste linéaire sur des entrées adverses.")
+    stress.add_argument("--sizes", type=int, nargs="+", default=[2_000, 20_000, 200_000])
+    stress.add_argument("--max-ratio", type=float, default=4.0, help="Croissance maximale tolérée du coût par caractère.")
+    stress.set_defaults(handler=_cli_stress_wrap)
+
+    watch = commands.add_parser("watch", help="Régénère PDF/HTML à chaque enregistrement du profil ou des presets.")
+    watch.add_argument("profile", help="Profil JSON (même structure que le bouton « Télécharger le profil »).")
+    watch.add_argument("--presets", help="Fichier JSON de presets (par défaut : presets intégrés).")
+    watch.add_argument("--out", default="cv_outputs", help="Dossier de sortie.")
+    watch.add_argument("--preset", action="append", help="Limiter à une déclinaison (option répétable).")
+    watch.add_argument("--formats", nargs="+", choices=["pdf", "html"], default=["pdf", "html"])
+    watch.add_argument("--theme", default="#0F766E", help="Couleur d’accent du PDF et du HTML.")
+    watch.add_argument("--minify-html", action="store_true", help="HTML minifié, limité aux règles CSS utilisées.")
+    watch.add_argument("--interval", type=float, default=0.2, help="Période de scrutation des fichiers (s).")
+    watch.add_argument("--debounce", type=float, default=0.3, help="Délai de stabilité avant rendu (s).")
+    watch.add_argument("--once", action="store_true", help="Un seul rendu puis sortie.")
+    watch.set_defaults(handler=_cli_watch)
+
+    loadtest = commands.add_parser("loadtest", help="Simule des sessions concurrentes via le moteur de test headless de Streamlit.")
+    loadtest.add_argument("--users", type=int, default=8, help="Nombre d’utilisateurs simultanés.")
+    loadtest.add_argument("--actions", type=int, default=20, help="Actions scriptées par utilisateur.")
+    loadtest.add_argument("--workers", type=int, help="Processus serveurs simulés (par défaut : un par cœur).")
+    loadtest.add_argument("--timeout", type=float, default=60.0, help="Délai maximal d’un rerun (s).")
+    loadtest.add_argument("--seed", type=int, default=0)
+    loadtest.add_argument("--json", action="store_true", help="Rapport complet au format JSON.")
+    loadtest.set_defaults(handler=_cli_loadtest)
+
+    check_undo = commands.add_parser("check-undo", help="Vérifie via le moteur de test headless qu’une suppression est annulable aussitôt.")
+    check_undo.add_argument("--timeout", type=float, default=60.0, help="Délai maximal d’un rerun (s).")
+    check_undo.set_defaults(handler=_cli_check_undo)
+
+    snapshot = commands.add_parser("snapshot", help="Fige une bibliothèque de profils en instantané binaire lisible par mmap.")
+    snapshot.add_argument("profiles", nargs="+", help="Profils JSON (le nom de fichier devient le nom du profil).")
+    snapshot.add_argument("--presets", help="Fichier JSON de presets à embarquer (par défaut : presets intégrés).")
+    snapshot.add_argument("--out", default="profils.cvlib", help="Fichier instantané produit.")
+    snapshot.set_defaults(handler=_cli_snapshot)
+
+    batch_add = commands.add_parser("batch-add", help="Ajoute des rendus profil × déclinaison à la file SQLite.")
+    batch_add.add_argument("profiles", nargs="+", help="Profils JSON ou instantanés de bibliothèque à rendre.")
+    batch_add.add_argument("--db", default="cv_batch.sqlite", help="Fichier SQLite de la file.")
+    batch_add.add_argument("--presets", help="Fichier JSON de presets (par défaut : presets de l’instantané ou intégrés).")
+    batch_add.add_argument("--preset", action="append", help="Limiter à une déclinaison (option répétable).")
+    batch_add.add_argument("--out", default="cv_outputs", help="Dossier de sortie (un sous-dossier par profil).")
+    batch_add.add_argument("--formats", nargs="+", choices=["pdf", "html"], default=["pdf", "html"])
+    batch_add.add_argument("--theme", default="#0F766E", help="Couleur d’accent du PDF et du HTML.")
+    batch_add.set_defaults(handler=_cli_batch_add)
+
+    batch_run = commands.add_parser("batch-run", help="Traite la file ; une relance reprend là où le lot s’est arrêté.")
+    batch_run.add_argument("--db", default="cv_batch.sqlite", help="Fichier SQLite de la file.")
+    batch_run.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processus de rendu.")
+    batch_run.add_argument("--lease", type=float, default=BATCH_LEASE_SECONDS, help="Âge (s) au-delà duquel une tâche « en cours » est reprise.")
+    batch_run.set_defaults(handler=_cli_batch_run)
+
+    batch_status = commands.add_parser("batch-status", help="Avancement et débit de la file, y compris pendant un lot.")
+    batch_status.add_argument("--db", default="cv_batch.sqlite", help="Fichier SQLite de la file.")
+    batch_status.add_argument("--follow", type=float, metavar="SECONDES", help="Rafraîchir jusqu’à la fin du lot.")
+    batch_status.add_argument("--json", action="store_true")
+    batch_status.set_defaults(handler=_cli_batch_status)
+    return parser
+
+
+def run_cli(argv: List[str]) -> int:
+    args = build_cli_parser().parse_args(argv)
+    return args.handler(args)
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and not st.runtime.exists():
+        sys.exit(run_cli(sys.argv[1:]))
     main()